@@ -0,0 +1,64 @@
+import os
+
+import pygame
+
+
+class AssetManager:
+    """Process-wide texture cache: each image file is loaded once and kept in the display format."""
+
+    def __init__(self):
+        self.textures: dict[str, pygame.Surface] = {}
+        self.converted: set[str] = set()
+        # requested path -> normalized key, so hot lookups skip os.path calls
+        self.aliases: dict[str, str] = {}
+
+    def key(self, path: str) -> str:
+        key = self.aliases.get(path)
+        if key is None:
+            key = os.path.normcase(os.path.abspath(path))
+            self.aliases[path] = key
+        return key
+
+    def load(self, path: str) -> pygame.Surface:
+        key = self.key(path)
+        texture = self.textures.get(key)
+        if texture is None:
+            self.textures[key] = pygame.image.load(path)
+            self.convert(key)
+            texture = self.textures[key]
+        return texture
+
+    def add(self, path: str, texture: pygame.Surface):
+        """Registers an image decoded elsewhere (e.g. on a loader thread) unless path is loaded already."""
+        key = self.key(path)
+        if key not in self.textures:
+            self.textures[key] = texture
+            self.convert(key)
+
+    def convert(self, key: str):
+        # conversion needs a display mode; textures loaded before it are converted by convertAll()
+        if key in self.converted or pygame.display.get_surface() is None:
+            return
+        texture = self.textures[key]
+        if texture.get_flags() & pygame.SRCALPHA:
+            texture = texture.convert_alpha()
+        else:
+            texture = texture.convert()
+        self.textures[key] = texture
+        self.converted.add(key)
+
+    def convertAll(self):
+        for key in list(self.textures):
+            self.convert(key)
+
+    def memoryUsage(self) -> dict[str, int]:
+        """Bytes of pixel data held per texture."""
+        return {key: texture.get_pitch() * texture.get_height() for key, texture in self.textures.items()}
+
+    def clear(self):
+        self.textures.clear()
+        self.converted.clear()
+        self.aliases.clear()
+
+
+assets = AssetManager()
@@ -0,0 +1,120 @@
+"""Plays many headless matches in parallel and aggregates the results.
+
+    python batch.py --levels maps/level1.tmx,maps/level3.tmx --matches 200 --player ai --output report.json
+
+--player is 'ai', 'idle' or the name of a replay file whose inputs are played.
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import glob
+import json
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+from game_state import GameState
+from events import UnitDestroyed
+from command import DecodeLevelCommand
+from simulation import Simulation, Controller, AIController, IdleController
+from replay import Replay
+
+
+class MatchStats:
+    def __init__(self, simulation: Simulation):
+        self.simulation = simulation
+        self.destroyed = Counter()
+        simulation.state.events.subscribe(UnitDestroyed, self.unitsDestroyed)
+
+    def unitsDestroyed(self, events: list[UnitDestroyed]):
+        for event in events:
+            side = 'player' if event.unit is self.simulation.playerUnit else 'enemies'
+            self.destroyed[side] += 1
+
+
+def makeController(player: str, seed: int) -> Controller:
+    if player == 'ai':
+        return AIController(seed)
+    if player == 'idle':
+        return IdleController()
+    return Replay.load(player).controller()
+
+
+def playMatch(match: dict) -> dict:
+    """Runs one match to the end or to maxTicks; executed in the worker processes."""
+    start = time.perf_counter()
+    simulation = Simulation()
+    simulation.loadLevel(match['level'])
+    stats = MatchStats(simulation)
+    simulation.run(makeController(match['player'], match['seed']), match['maxTicks'])
+
+    return {
+        **match,
+        'winner': simulation.winner,
+        'epochs': simulation.state.epoch,
+        'shotsFired': simulation.state.shotsFired,
+        'enemiesDestroyed': stats.destroyed['enemies'],
+        'playerDestroyed': stats.destroyed['player'],
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def summarize(results: list[dict]) -> dict:
+    epochs = [result['epochs'] for result in results]
+    return {
+        'matches': len(results),
+        'winners': dict(Counter(str(result['winner']) for result in results)),
+        'epochs.mean': statistics.fmean(epochs),
+        'epochs.median': statistics.median(epochs),
+        'shotsFired': sum(result['shotsFired'] for result in results),
+        'enemiesDestroyed': sum(result['enemiesDestroyed'] for result in results),
+        'playerDestroyed': sum(result['playerDestroyed'] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--levels', default='', help='comma separated .tmx files (all maps/*.tmx if omitted)')
+    parser.add_argument('--matches', type=int, default=100, help='matches per level')
+    parser.add_argument('--player', default='ai', help="'ai', 'idle' or a replay file")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first match, the others count up')
+    parser.add_argument('--ticks', type=int, default=10000, help='epochs after which a match is a draw')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--output', help='JSON file for the report (stdout if omitted)')
+    args = parser.parse_args()
+
+    levels = [level for level in args.levels.split(',') if level] or sorted(glob.glob(join('maps', '*.tmx')))
+    # compile the levels once up front, so the workers only read the cache
+    for level in levels:
+        DecodeLevelCommand(GameState(), level).run()
+
+    matches = [{'level': level, 'seed': args.seed + index, 'player': args.player, 'maxTicks': args.ticks}
+               for level in levels for index in range(args.matches)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        chunkSize = max(1, len(matches) // (4 * args.jobs))
+        results = list(pool.map(playMatch, matches, chunksize=chunkSize))
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'meta': {'jobs': args.jobs, 'player': args.player, 'seconds': elapsed},
+        'total': summarize(results),
+        'levels': {level: summarize([result for result in results if result['level'] == level]) for level in levels},
+        'matches': results,
+    }
+    print('{} matches in {:.2f} s on {} processes'.format(len(results), elapsed, args.jobs))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps({key: report[key] for key in ('meta', 'total', 'levels')}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""Headless benchmarks for rendering, simulation and level loading.
+
+Runs under the SDL dummy video driver, so no window is needed:
+
+    python benchmark.py --sizes 16x10,256x256 --units 500 --bullets 2000 --output bench.json
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import tempfile
+import time
+from os.path import join
+from typing import Callable, Optional
+
+import numpy as np
+import pygame
+from pygame import Vector2
+
+from game_state import GameState
+from layer import ArrayLayer, UnitsLayer, RotationCache, MAX_BAKED_SIZE
+from camera import Camera
+from interpolation import TickHistory
+from command import DecodeLevelCommand
+from unit import Tank, Tower, ALIVE
+from tile_grid import EMPTY
+from assets import assets
+
+
+GROUND_IMAGE = join('images', 'background', 'ground.png')
+WALLS_IMAGE = join('images', 'background', 'walls.png')
+UNITS_IMAGE = join('images', 'units', 'units.png')
+EXPLOSIONS_IMAGE = join('images', 'explosions', 'explosions.png')
+
+
+class BenchmarkHost:
+    """The parts of UserInterface that layers use."""
+
+    def __init__(self, cellSize: Vector2, worldSize: Vector2, viewSize: tuple[int, int]):
+        self.cellSize = cellSize
+        self.rotationCache = RotationCache()
+        self.camera = Camera(viewSize, cellSize)
+        self.camera.setWorld(worldSize, cellSize)
+        self.history = TickHistory()
+        self.alpha = 1.0
+
+    @property
+    def cellWidth(self):
+        return int(self.cellSize.x)
+
+    @property
+    def cellHeight(self):
+        return int(self.cellSize.y)
+
+
+def makeWorld(width: int, height: int, unitCount: int, bulletCount: int, seed: int) -> GameState:
+    rng = random.Random(seed)
+    state = GameState()
+    state.worldSize = Vector2(width, height)
+
+    groundTiles = [21, 22, 23]      # (5, 1), (6, 1), (7, 1) in the 16 column tileset
+    ground = np.array([[rng.choice(groundTiles) for _ in range(width)] for _ in range(height)], dtype=np.int32)
+    state.ground.reset(width, height, 16, ground)
+    walls = np.array([[17 if rng.random() < 0.05 else EMPTY for _ in range(width)] for _ in range(height)], dtype=np.int32)
+    state.walls.reset(width, height, 16, walls)
+
+    cells = rng.sample(range(width * height), min(unitCount, width * height))
+    tankTile, towerTile = Vector2(1, 0), Vector2(0, 1)
+    units = []
+    for index, cell in enumerate(cells):
+        y, x = divmod(cell, width)
+        if index == 0:
+            units.append(Tank(state, Vector2(x, y), tankTile))
+        else:
+            units.append(Tower(state, Vector2(x, y), towerTile))
+    state.units[:] = units
+    state.rebuildUnitGrid()
+
+    spawnBullets(state, bulletCount, rng)
+    return state
+
+
+def spawnBullets(state: GameState, bulletCount: int, rng: random.Random):
+    state.bullets.clear()
+    if len(state.units) == 0:
+        return
+    while len(state.bullets) < bulletCount:
+        unit = rng.choice(state.units)
+        unit.weaponTarget = Vector2(rng.uniform(0, state.worldWidth), rng.uniform(0, state.worldHeight))
+        state.bullets.spawn(unit)
+
+
+def writeLevel(fileName: str, width: int, height: int, unitCount: int, seed: int):
+    """Writes a synthetic .tmx level using the game's tilesets."""
+    rng = random.Random(seed)
+    mapDir = os.path.dirname(os.path.abspath(fileName))
+    cells = rng.sample(range(width * height), min(unitCount, width * height))
+
+    ground = [str(rng.choice([114, 115, 116])) for _ in range(width * height)]
+    walls = ['274' if rng.random() < 0.05 else '0' for _ in range(width * height)]
+    tanks = ['0'] * (width * height)
+    towers = ['0'] * (width * height)
+    for index, cell in enumerate(cells):
+        walls[cell] = '0'
+        if index == 0:
+            tanks[cell] = '516'
+        else:
+            towers[cell] = '530'
+
+    def image(path):
+        return os.path.relpath(os.path.abspath(path), mapDir)
+
+    def layer(layerId, name, tiles):
+        rows = [','.join(tiles[y * width:(y + 1) * width]) for y in range(height)]
+        return ' <layer id="{}" name="{}" width="{}" height="{}">\n  <data encoding="csv">\n{}\n</data>\n </layer>\n'.format(
+            layerId, name, width, height, ',\n'.join(rows))
+
+    with open(fileName, 'w') as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        file.write('<map version="1.10" orientation="orthogonal" renderorder="right-down" width="{}" height="{}" '
+                   'tilewidth="64" tileheight="64" infinite="0" nextlayerid="6" nextobjectid="1">\n'.format(width, height))
+        for firstgid, name, path, columns, size in (
+                (1, 'ground', GROUND_IMAGE, 16, 1024),
+                (257, 'walls', WALLS_IMAGE, 16, 1024),
+                (513, 'units', UNITS_IMAGE, 16, 1024),
+                (769, 'explosions', EXPLOSIONS_IMAGE, 32, 2048)):
+            file.write(' <tileset firstgid="{}" name="{}" tilewidth="64" tileheight="64" tilecount="{}" columns="{}">\n'
+                       '  <image source="{}" width="{}" height="{}"/>\n </tileset>\n'.format(
+                           firstgid, name, columns * columns, columns, image(path), size, size))
+        file.write(layer(1, 'Ground', ground))
+        file.write(layer(2, 'Walls', walls))
+        file.write(layer(3, 'Towers', towers))
+        file.write(layer(4, 'Tanks', tanks))
+        file.write(layer(5, 'Bullets', ['0'] * (width * height)))
+        file.write('</map>\n')
+
+
+def measure(name: str, params: dict, func: Callable, setup: Optional[Callable] = None,
+            repeat: int = 5, number: int = 1) -> dict:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    result = {
+        'name': name,
+        **params,
+        'repeat': repeat,
+        'number': number,
+        'min': min(times),
+        'median': statistics.median(times),
+        'mean': statistics.fmean(times),
+    }
+    print('{:<28} {:<40} median {:10.3f} ms'.format(
+        name, ' '.join('{}={}'.format(k, v) for k, v in params.items()), result['median'] * 1000))
+    return result
+
+
+def benchmarkWorld(width: int, height: int, unitCount: int, bulletCount: int,
+                   repeat: int, seed: int, selected: Callable[[str], bool]) -> list[dict]:
+    results = []
+    params = {'width': width, 'height': height, 'units': unitCount, 'bullets': bulletCount}
+    state = makeWorld(width, height, unitCount, bulletCount, seed)
+    surface = pygame.Surface(pygame.display.get_surface().get_size())
+    host = BenchmarkHost(Vector2(64, 64), state.worldSize, surface.get_size())
+    # view in the middle of the world, like a camera following the player
+    host.camera.follow(state.worldSize / 2)
+    rng = random.Random(seed)
+
+    groundLayer = ArrayLayer(host, GROUND_IMAGE, state, state.ground, baked=False)
+    unitsLayer = UnitsLayer(host, UNITS_IMAGE, state, state.units)
+
+    if selected('renderTile'):
+        positions = [Vector2(rng.randrange(16), rng.randrange(10)) for _ in range(1000)]
+        tile = Vector2(1, 0)
+        def renderTiles():
+            for position in positions:
+                groundLayer.renderTile(surface, position, tile)
+        results.append(measure('renderTile', {'calls': len(positions)}, renderTiles, repeat=repeat))
+
+    if selected('renderTile.rotated'):
+        angles = [rng.uniform(0, 360) for _ in range(1000)]
+        def renderRotatedTiles():
+            for angle in angles:
+                groundLayer.renderTile(surface, Vector2(1, 1), Vector2(1, 0), angle)
+        results.append(measure('renderTile.rotated', {'calls': len(angles)}, renderRotatedTiles, repeat=repeat))
+
+    if selected('ArrayLayer.render'):
+        results.append(measure('ArrayLayer.render', params, lambda: groundLayer.render(surface), repeat=repeat))
+
+    if selected('ArrayLayer.render.baked') and width * 64 <= MAX_BAKED_SIZE and height * 64 <= MAX_BAKED_SIZE:
+        bakedLayer = ArrayLayer(host, GROUND_IMAGE, state, state.ground)
+        bakedLayer.render(surface)
+        results.append(measure('ArrayLayer.render.baked', params, lambda: bakedLayer.render(surface), repeat=repeat))
+
+    if selected('UnitsLayer.render'):
+        results.append(measure('UnitsLayer.render', params, lambda: unitsLayer.render(surface), repeat=repeat))
+
+    if selected('bullets.step'):
+        bulletRng = random.Random(seed)
+        def resetBullets():
+            state.units[:] = [unit for unit in state.units if unit.status == ALIVE]
+            state.rebuildUnitGrid()
+            spawnBullets(state, bulletCount, bulletRng)
+        results.append(measure('bullets.step', params, lambda: state.bullets.step(state),
+                               setup=resetBullets, repeat=repeat))
+
+    if selected('findLiveUnit'):
+        queries = [Vector2(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(1000)]
+        def findUnits():
+            for position in queries:
+                state.findLiveUnit(position)
+        results.append(measure('findLiveUnit', {**params, 'calls': len(queries)}, findUnits, repeat=repeat))
+
+    if selected('LoadLevelCommand.run'):
+        with tempfile.TemporaryDirectory() as tmpDir:
+            fileName = join(tmpDir, 'level.tmx')
+            writeLevel(fileName, width, height, unitCount, seed)
+            levelParams = {'width': width, 'height': height, 'units': unitCount}
+            loadState = GameState()
+            results.append(measure('LoadLevelCommand.run', levelParams,
+                                   lambda: DecodeLevelCommand(loadState, fileName, useCache=False).run(),
+                                   repeat=repeat))
+            DecodeLevelCommand(loadState, fileName, cacheDir=tmpDir).run()
+            results.append(measure('LoadLevelCommand.run.cached', levelParams,
+                                   lambda: DecodeLevelCommand(loadState, fileName, cacheDir=tmpDir).run(),
+                                   repeat=repeat))
+
+    return results
+
+
+def parseSize(text: str) -> tuple[int, int]:
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='16x10,64x64,256x256,1024x1024',
+                        help='comma separated world sizes, e.g. 16x10,256x256')
+    parser.add_argument('--units', type=int, default=100, help='units per world')
+    parser.add_argument('--bullets', type=int, default=500, help='live bullets per world')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default='', help='comma separated benchmark names to run')
+    parser.add_argument('--output', help='JSON file for the results (stdout if omitted)')
+    args = parser.parse_args()
+
+    only = [name for name in args.only.split(',') if name]
+    def selected(name):
+        return not only or name in only
+
+    pygame.init()
+    pygame.display.set_mode((16 * 64, 10 * 64))
+    assets.convertAll()
+
+    results = []
+    for size in args.sizes.split(','):
+        width, height = parseSize(size)
+        results.extend(benchmarkWorld(width, height, args.units, args.bullets, args.repeat, args.seed, selected))
+
+    report = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'videoDriver': os.environ.get('SDL_VIDEODRIVER'),
+        },
+        'results': results,
+    }
+    pygame.quit()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
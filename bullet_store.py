@@ -0,0 +1,187 @@
+import numpy as np
+from pygame import Vector2
+
+from unit import ALIVE, DESTROYED
+from events import UnitDestroyed
+from grid_traversal import traverseCells
+from tile_grid import EMPTY
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from game_state import GameState
+    from unit import Unit
+
+
+class BulletStore:
+    """Struct-of-arrays storage of bullets, advanced in one batched step per tick."""
+
+    def __init__(self, capacity: int = 256):
+        self.count = 0
+        self.nextId = 0         # ids stay unique for the lifetime of the store
+        self.tile = Vector2(6, 1)
+
+        self.position = np.zeros((capacity, 2), dtype=np.float64)
+        self.direction = np.zeros((capacity, 2), dtype=np.float64)
+        self.start = np.zeros((capacity, 2), dtype=np.float64)
+        self.owner = np.empty(capacity, dtype=object)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.alive)
+
+    def clear(self):
+        self.owner[:self.count] = None
+        self.count = 0
+
+    def positions(self) -> np.ndarray:
+        return self.position[:self.count]
+
+    def grow(self):
+        capacity = self.capacity * 2
+        for name in ('position', 'direction', 'start', 'owner', 'alive', 'ids'):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            if old.dtype == object:
+                new[:] = None
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+
+    def spawn(self, unit: "Unit") -> bool:
+        direction = unit.weaponTarget - unit.position
+        if direction.length_squared() == 0:
+            return False
+        direction = direction.normalize()
+
+        if self.count == self.capacity:
+            self.grow()
+        i = self.count
+        self.position[i] = (unit.x, unit.y)
+        self.direction[i] = direction
+        self.start[i] = (unit.x, unit.y)
+        self.owner[i] = unit
+        self.alive[i] = True
+        self.ids[i] = self.nextId
+        self.nextId += 1
+        self.count += 1
+        return True
+
+
+    def step(self, state: "GameState", count: int = None):
+        """Moves the first count bullets (all by default) and resolves their hits."""
+        n = self.count if count is None else count
+        if n == 0:
+            return
+        alive = self.alive[:n]
+        newPos = self.position[:n] + self.direction[:n] * (state.bulletSpeed * 0.1)
+
+        # outside the screen or outside the range
+        inside = (newPos[:, 0] >= 0) & (newPos[:, 1] >= 0) \
+            & (newPos[:, 0] < state.worldWidth) & (newPos[:, 1] < state.worldHeight)
+        offset = newPos - self.start[:n]
+        inRange = offset[:, 0] ** 2 + offset[:, 1] ** 2 < state.bulletRange ** 2
+
+        # bullets leaving the world or their range still hit what lies on the way out
+        endPos = newPos.copy()
+        leaving = np.flatnonzero(alive & ~(inside & inRange))
+        if len(leaving) > 0:
+            endPos[leaving] = self.clipSegments(state, leaving, newPos[leaving])
+
+        # bullets are drawn centered on position + 0.5, so that point is swept through the grid
+        oldCells = (self.position[:n] + 0.5).astype(np.intp)
+        cells = (endPos + 0.5).astype(np.intp)
+        cellX, cellY = cells[:, 0], cells[:, 1]
+        inWorld = (oldCells[:, 0] < state.worldWidth) & (oldCells[:, 1] < state.worldHeight) \
+            & (cellX < state.worldWidth) & (cellY < state.worldHeight)
+        crossing = alive & np.any(oldCells != cells, axis=1)
+        moved = alive.copy()
+
+        # most bullets stay inside one cell, test them all at once against walls and units
+        index = np.flatnonzero(alive & ~crossing & inWorld)
+        inWall = state.walls.getMany(cellX[index], cellY[index]) != EMPTY
+        alive[index[inWall]] = False
+        moved[index[inWall]] = False
+        index = index[~inWall]
+        units = state.unitGrid.getMany(cellX[index], cellY[index])
+        occupied = units != None
+        for i, unit in zip(index[occupied].tolist(), units[occupied].tolist()):
+            self.hit(state, i, unit, alive, moved)
+
+        # the others walk the cells their segment crosses and stop at the first wall or unit;
+        # a segment shorter than a cell only touches the box of its end cells, skip it if that is empty
+        index = np.flatnonzero(crossing)
+        short = np.all(np.abs(cells[index] - oldCells[index]) <= 1, axis=1) & inWorld[index]
+        boxed = index[short]
+        blocked = np.zeros(len(boxed), dtype=bool)
+        for x, y in ((oldCells[boxed, 0], oldCells[boxed, 1]), (cellX[boxed], oldCells[boxed, 1]),
+                     (oldCells[boxed, 0], cellY[boxed]), (cellX[boxed], cellY[boxed])):
+            units = state.unitGrid.getMany(x, y)
+            blocked |= (state.walls.getMany(x, y) != EMPTY) | ((units != None) & (units != self.owner[boxed]))
+        for i in np.concatenate([index[~short], boxed[blocked]]).tolist():
+            x0, y0 = self.position[i] + 0.5
+            x1, y1 = endPos[i] + 0.5
+            for x, y in traverseCells(x0, y0, x1, y1):
+                if x < 0 or y < 0 or x >= state.worldWidth or y >= state.worldHeight:
+                    continue
+                if not state.walls.isEmpty(x, y):
+                    alive[i] = False
+                    moved[i] = False
+                    break
+                unit = state.unitGrid.get(x, y)
+                if unit is not None and self.hit(state, i, unit, alive, moved):
+                    break
+
+        # whatever was not hit on the way out is gone now
+        alive &= inside & inRange
+        moved &= alive
+        self.position[:n][moved] = newPos[moved]
+
+
+    def clipSegments(self, state: "GameState", index: np.ndarray, newPos: np.ndarray) -> np.ndarray:
+        """End points of the moves of bullets index, cut at their range circle and at the world border."""
+        position = self.position[index]
+        move = newPos - position
+        t = np.ones(len(index))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # |position + t * move - start| = bulletRange, the bullet starts inside the circle
+            relative = position - self.start[index]
+            a = np.sum(move * move, axis=1)
+            b = 2 * np.sum(relative * move, axis=1)
+            c = np.sum(relative * relative, axis=1) - state.bulletRange ** 2
+            root = (-b + np.sqrt(np.maximum(b * b - 4 * a * c, 0))) / (2 * a)
+            t = np.minimum(t, np.where(a > 0, root, 1))
+            for axis, size in ((0, state.worldWidth), (1, state.worldHeight)):
+                d, p = move[:, axis], position[:, axis]
+                t = np.minimum(t, np.where(d > 0, (size - p) / d, np.inf))
+                t = np.minimum(t, np.where(d < 0, -p / d, np.inf))
+        return position + move * np.clip(t, 0, 1)[:, None]
+
+
+    def hit(self, state: "GameState", i: int, unit: "Unit", alive: np.ndarray, moved: np.ndarray) -> bool:
+        if unit.status != ALIVE or self.owner[i] is unit:
+            return False
+        unit.status = DESTROYED
+        alive[i] = False
+        moved[i] = False
+        state.events.post(UnitDestroyed(unit))
+        return True
+
+    def deleteDestroyed(self):
+        n = self.count
+        keep = self.alive[:n]
+        k = int(np.count_nonzero(keep))
+        if k == n:
+            return
+        for array in (self.position, self.direction, self.start, self.owner, self.ids):
+            array[:k] = array[:n][keep]
+        self.owner[k:n] = None
+        self.alive[:k] = True
+        self.alive[k:n] = False
+        self.count = k
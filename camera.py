@@ -0,0 +1,54 @@
+import math
+from typing import Tuple
+
+import pygame
+from pygame import Vector2
+
+
+class Camera:
+    """Fixed-size view on the world; offset is the world pixel shown at the window's top-left corner."""
+
+    def __init__(self, viewSize: Tuple[int, int], cellSize: Vector2):
+        self.viewSize = Vector2(viewSize)
+        self.cellSize = Vector2(cellSize)
+        self.worldSize = Vector2(0, 0)
+        self.offset = Vector2(0, 0)
+
+    def setWorld(self, worldSize: Vector2, cellSize: Vector2):
+        self.worldSize = Vector2(worldSize)
+        self.cellSize = Vector2(cellSize)
+
+    @property
+    def worldPixels(self) -> Vector2:
+        return self.worldSize.elementwise() * self.cellSize
+
+    def follow(self, position: Vector2):
+        # center on the cell, stop at the world borders; small worlds are centered
+        center = (position + Vector2(0.5, 0.5)).elementwise() * self.cellSize
+        offset = Vector2()
+        for axis in (0, 1):
+            world = self.worldPixels[axis]
+            view = self.viewSize[axis]
+            if world <= view:
+                offset[axis] = (world - view) // 2
+            else:
+                offset[axis] = min(max(0, int(center[axis] - view / 2)), world - view)
+        self.offset = offset
+
+    @property
+    def rect(self) -> pygame.Rect:
+        return pygame.Rect(int(self.offset.x), int(self.offset.y), int(self.viewSize.x), int(self.viewSize.y))
+
+    def visibleCells(self) -> Tuple[int, int, int, int]:
+        """(x0, y0, x1, y1) range of cells inside the view, x1 and y1 excluded."""
+        x0 = max(0, int(self.offset.x // self.cellSize.x))
+        y0 = max(0, int(self.offset.y // self.cellSize.y))
+        x1 = min(int(self.worldSize.x), int(math.ceil((self.offset.x + self.viewSize.x) / self.cellSize.x)))
+        y1 = min(int(self.worldSize.y), int(math.ceil((self.offset.y + self.viewSize.y) / self.cellSize.y)))
+        return x0, y0, x1, y1
+
+    def worldToScreen(self, position: Vector2) -> Vector2:
+        return position.elementwise() * self.cellSize - self.offset
+
+    def screenToWorld(self, pixels: Vector2) -> Vector2:
+        return (Vector2(pixels) + self.offset).elementwise() / self.cellSize
@@ -1,17 +1,21 @@
 import os
 import tmx
+import numpy as np
 
-import pygame
 from pygame import Vector2
 
 from typing import TYPE_CHECKING, Tuple
 
 if TYPE_CHECKING:
     from game_state import GameState
-    from unit import Unit, GameItem
+    from unit import Unit
     from user_interface import UserInterface
+    from level_loader import PreparedLevel
 
-from unit import Bullet, Tank, Tower, Unit
+from unit import Tank, Tower, Unit
+import level_cache
+from level_cache import CompiledLevel
+from events import LevelLoaded
 
 
 
@@ -32,33 +36,7 @@ class MoveCommand(Command):
         self.moveVector = moveVector
     
     def run(self):
-        newPos = self.unit.position + self.moveVector
-        if not self.state.inside_world(newPos):
-            return
-    
-
-        # Collisions with walls aren't allowed
-        if not self.state.walls[int(newPos.y)][int(newPos.x)] is None:
-            return
-        
-        
-        # Collisions with other unit aren't allowed
-        for unit in self.state.units:
-            if unit != self.unit:
-                if unit.position == newPos:
-                    return
-        
-        self.unit.position = newPos  
-
-        # choose orientation  
-        if self.moveVector.x < 0: 
-            self.unit.orientation = 90
-        elif self.moveVector.x > 0: 
-            self.unit.orientation = -90
-        if self.moveVector.y < 0: 
-            self.unit.orientation = 0
-        elif self.moveVector.y > 0: 
-            self.unit.orientation = 180
+        self.state.tryMove(self.unit, int(self.moveVector.x), int(self.moveVector.y))
         
 
 class TargetCommand(Command):
@@ -78,60 +56,122 @@ class ShootCommand(Command):
         self.unit = unit
 
     def run(self):
-        if self.unit.status != 'alive':
-            return
-        if self.state.epoch - self.unit.lastBulletEpoch < self.state.bulletDelay:
-            return
-        self.unit.lastBulletEpoch = self.state.epoch
-        self.state.bullets.append(Bullet(self.state, self.unit))
+        self.state.shoot(self.unit)
 
 
-class MoveBulletCommand(Command):
-    def __init__(self, state: "GameState", bullet: "Bullet"):
-        self.state = state
-        self.bullet = bullet
-    
+class LoadLevelCommand(Command):
+    def __init__(self, ui: "UserInterface", fileName: str, prepared: "PreparedLevel" = None):
+        self.ui = ui
+        self.fileName = fileName
+        self.prepared = prepared
+
     def run(self):
-        newPos = self.bullet.position + self.bullet.direction * self.state.bulletSpeed * 0.1
-        newCenterPos = newPos + Vector2(0.5, 0.5)
+        compiled = None
+        if self.prepared is not None:
+            # parsed and decoded in the background, nothing left to read from disk
+            self.prepared.install()
+            compiled = self.prepared.level
+        level = DecodeLevelCommand(self.ui.gameState, self.fileName, level=compiled)
+        level.run()
+
+        cellSize = level.cellSize
+        self.ui.layers[0].setTileset(cellSize, level.groundImage)
+        self.ui.layers[1].setTileset(cellSize, level.wallsImage)
+        self.ui.layers[2].setTileset(cellSize, level.unitsImage)
+        self.ui.layers[3].setTileset(cellSize, level.bulletsImage)
 
-        # outside the screen
-        if not self.state.inside_world(newPos):
-            self.bullet.status = 'destroyed'
-            return
+        # set player Unit
+        self.ui.playerUnit = level.playerUnit
 
-        # outside the range
-        if newPos.distance_to(self.bullet.startPosition) >= self.state.bulletRange:
-            self.bullet.status = 'destroyed'
-            return
-        
-        # 
-        unit = self.state.findLiveUnit(newCenterPos)
-        if not unit is None and self.bullet.unit != unit:
-            unit.status = 'destroyed'
-            self.bullet.status = 'destroyed'
-            self.state.notifyDestroyed(unit)
-            return
-        
-        self.bullet.position = newPos
+        self.ui.camera.setWorld(self.ui.gameState.worldSize, cellSize)
 
 
-class DeleteDestroyedCommand(Command):
-    def __init__(self, itemList: list["GameItem"]):
-        self.itemList = itemList
-    
-    def run(self):
-        self.itemList[:] = [item for item in self.itemList if item.status == 'alive']
-        
+class DecodeLevelCommand(Command):
+    """Loads a level into a GameState only; needs no window or layers.
 
-class LoadLevelCommand(Command):
-    def __init__(self, ui: "UserInterface", fileName: str):
-        self.ui = ui
+    Parsed levels are compiled to dense arrays and cached (see level_cache),
+    so later loads of an unchanged .tmx file skip the XML entirely.
+    """
+
+    def __init__(self, state: "GameState", fileName: str, useCache: bool = True, cacheDir: str = None,
+                 level: CompiledLevel = None):
+        self.state = state
         self.fileName = fileName
+        self.useCache = useCache
+        self.cacheDir = cacheDir
+        self.level = level      # already compiled, e.g. by the level loader
+
+        # filled by run()
+        self.cellSize: Vector2 = None
+        self.groundImage: str = None
+        self.wallsImage: str = None
+        self.unitsImage: str = None
+        self.bulletsImage: str = None
+        self.playerUnit: "Unit" = None
 
     def run(self):
+        if self.level is not None:
+            self.applyLevel(self.level)
+            return
         if not os.path.exists(self.fileName):
             raise RuntimeError('No such file {}'.format(self.fileName))
+        self.applyLevel(self.loadLevel())
+
+    def loadLevel(self) -> CompiledLevel:
+        if not self.useCache:
+            return self.compileLevel()
+
+        cacheFile = level_cache.cachePath(self.fileName, self.cacheDir)
+        if os.path.exists(cacheFile):
+            try:
+                return CompiledLevel.load(cacheFile)
+            except (OSError, ValueError, KeyError, RuntimeError):
+                pass    # stale or broken cache, compile again
+
+        level = self.compileLevel()
+        try:
+            os.makedirs(os.path.dirname(cacheFile), exist_ok=True)
+            level.save(cacheFile)
+        except OSError:
+            pass        # read-only location, the cache is only an optimization
+        return level
+
+    def applyLevel(self, level: CompiledLevel):
+        state = self.state
+        state.worldSize = Vector2(level.width, level.height)
+        # tiles are copied chunk by chunk from the memory-mapped level on first access
+        state.ground.reset(level.width, level.height, level.groundColumns, level.ground)
+        state.walls.reset(level.width, level.height, level.wallsColumns, level.walls)
+
+        # load tank and towers 
+        tiles: dict[tuple[int, int], Vector2] = {}      # units of the same kind share their tile
+        units = []
+        for kind, x, y, tileX, tileY in level.units.tolist():
+            if (tileX, tileY) not in tiles:
+                tiles[tileX, tileY] = Vector2(tileX, tileY)
+            clsUnit = Tank if kind == level_cache.TANK else Tower
+            units.append(clsUnit(state=state, position=Vector2(x, y), tile=tiles[tileX, tileY]))
+        state.units[:] = units
+        state.rebuildUnitGrid()
+
+        # set player Unit
+        self.playerUnit = units[0]
+
+        state.bullets.clear()
+        state.epoch = 0
+        state.shotsFired = 0
+        # events of the previous level are stale
+        state.events.clear()
+        state.events.post(LevelLoaded(self.fileName))
+
+        mapDir = os.path.dirname(self.fileName)
+        self.groundImage = os.path.join(mapDir, level.images['ground'])
+        self.wallsImage = os.path.join(mapDir, level.images['walls'])
+        self.unitsImage = os.path.join(mapDir, level.images['units'])
+        self.bulletsImage = os.path.join(mapDir, level.images['bullets'])
+        self.cellSize = Vector2(level.cellSize)
+
+    def compileLevel(self) -> CompiledLevel:
         tileMap: tmx.TileMap = tmx.TileMap.load(self.fileName)
 
         if tileMap.orientation != 'orthogonal':
@@ -140,109 +180,84 @@ class LoadLevelCommand(Command):
         if len(tileMap.layers) != 5:
             raise RuntimeError("Error in {}: 5 layers are expected".format(self.fileName))
         
-
-        state = self.ui.gameState
-        state.worldSize = Vector2(tileMap.width,tileMap.height) 
+        mapDir = os.path.dirname(self.fileName)
+        images = {}
 
         # load Ground tileset
-        tileset, array = self.decodeArrayLayer(tileMap,tileMap.layers[0])
-        cellSize = Vector2(tileset.tilewidth,tileset.tileheight)
-        state.ground[:] = array
-        imageFile = tileset.image.source
-        self.ui.layers[0].setTileset(cellSize, imageFile)
+        groundTileset, ground = self.decodeArrayLayer(tileMap,tileMap.layers[0])
+        cellSize = (groundTileset.tilewidth, groundTileset.tileheight)
+        images['ground'] = os.path.relpath(groundTileset.image.source, mapDir or '.')
 
         # load walls tilesets
-        tileset, array = self.decodeArrayLayer(tileMap,tileMap.layers[1])
-        if tileset.tilewidth != cellSize.x or tileset.tileheight != cellSize.y:
-            raise RuntimeError("Error in {}: tile sizes must be the same in all layers".format(self.fileName))
-        state.walls[:] = array
-        imageFile = tileset.image.source
-        self.ui.layers[1].setTileset(cellSize,imageFile)
+        wallsTileset, walls = self.decodeArrayLayer(tileMap,tileMap.layers[1])
+        self.checkTileSize(wallsTileset, cellSize)
+        images['walls'] = os.path.relpath(wallsTileset.image.source, mapDir or '.')
 
         # load tank and towers 
-        tanksTileset, tanks = self.decodeUnitsLayer(state,tileMap,tileMap.layers[3], Tank)
-        towersTileset, towers = self.decodeUnitsLayer(state,tileMap,tileMap.layers[2], Tower)
+        tanksTileset, tanks = self.decodeUnitsLayer(tileMap,tileMap.layers[3], level_cache.TANK)
+        towersTileset, towers = self.decodeUnitsLayer(tileMap,tileMap.layers[2], level_cache.TOWER)
         if tanksTileset != towersTileset:
             raise RuntimeError("Error in {}: tanks and towers tilesets must be the same".format(self.fileName))
-        if tanksTileset.tilewidth != cellSize.x or tanksTileset.tileheight != cellSize.y:
-            raise RuntimeError("Error in {}: tile sizes must be the same in all layers".format(self.fileName))
-        state.units[:] = tanks + towers
-        cellSize = Vector2(tanksTileset.tilewidth,tanksTileset.tileheight)
-        imageFile = tanksTileset.image.source
-        self.ui.layers[2].setTileset(cellSize,imageFile)
-
-        # set player Unit
-        self.ui.playerUnit = tanks[0]
-
+        self.checkTileSize(tanksTileset, cellSize)
+        if len(tanks) == 0:
+            raise RuntimeError("Error in {}: no player tank".format(self.fileName))
+        images['units'] = os.path.relpath(tanksTileset.image.source, mapDir or '.')
 
         # load bullets
-        tileset, array = self.decodeArrayLayer(tileMap,tileMap.layers[4])
-        if tileset.tilewidth != cellSize.x or tileset.tileheight != cellSize.y:
+        bulletsTileset, _ = self.decodeArrayLayer(tileMap,tileMap.layers[4])
+        self.checkTileSize(bulletsTileset, cellSize)
+        images['bullets'] = os.path.relpath(bulletsTileset.image.source, mapDir or '.')
+
+        units = np.array(tanks + towers, dtype=np.int32).reshape(-1, 5)
+        return CompiledLevel(
+            tileMap.width, tileMap.height, cellSize, images,
+            groundTileset.columns, wallsTileset.columns,
+            ground, walls, units,
+        )
+
+    def checkTileSize(self, tileset: tmx.Tileset, cellSize: tuple[int, int]):
+        if tileset.tilewidth != cellSize[0] or tileset.tileheight != cellSize[1]:
             raise RuntimeError("Error in {}: tile sizes must be the same in all layers".format(self.fileName))
-        state.bullets.clear()
-        imageFile = tileset.image.source
-        self.ui.layers[3].setTileset(cellSize,imageFile)
 
-        windowSize = state.worldSize.elementwise() * cellSize
-        self.ui.window = pygame.display.set_mode((int(windowSize.x),int(windowSize.y))) 
+    def layerIds(self, tileMap: tmx.TileMap, layer: tmx.Layer) -> np.ndarray:
+        if not isinstance(layer, tmx.Layer):
+            raise RuntimeError("Error in {}: invalid layer type".format(self.fileName))
+        if len(layer.tiles) != tileMap.width * tileMap.height:
+            raise RuntimeError("Error in {}: invalid layer size".format(self.fileName))
+        return np.fromiter((tile.gid for tile in layer.tiles), dtype=np.int64, count=len(layer.tiles))
 
-        
-    
-    def decodeArrayLayer(self, tileMap: tmx.TileMap, layer: tmx.Layer) -> Tuple[tmx.Tileset, list[list[Vector2]]]:
-        tileset = self.decodeLayer(tileMap, layer)
-
-        array: list[list[Vector2]] = [None] * tileMap.height
-        for y in range(tileMap.height):
-            array[y] = [None] * tileMap.width
-            for x in range(tileMap.width):
-                tile = layer.tiles[x + y * tileMap.width]
-                if tile.gid == 0:
-                    continue # 274 = 531 - 257
-                lid = tile.gid - tileset.firstgid
-                if lid < 0 or lid >= tileset.tilecount:
-                    raise RuntimeError("Error in {}: invalid tile id".format(self.fileName))
-                
-                tileX = lid % tileset.columns
-                tileY = lid // tileset.columns
-                array[y][x] = Vector2(tileX, tileY)
+    def localIds(self, gids: np.ndarray, tileset: tmx.Tileset) -> np.ndarray:
+        lids = np.where(gids == 0, -1, gids - tileset.firstgid)
+        used = gids != 0
+        if np.any(used & ((lids < 0) | (lids >= tileset.tilecount))):
+            raise RuntimeError("Error in {}: invalid tile id".format(self.fileName))
+        return lids.astype(np.int32)
 
+    def decodeArrayLayer(self, tileMap: tmx.TileMap, layer: tmx.Layer) -> Tuple[tmx.Tileset, np.ndarray]:
+        gids = self.layerIds(tileMap, layer)
+        tileset = self.decodeLayer(tileMap, gids)
+        lids = self.localIds(gids, tileset)
+        return tileset, lids.reshape(tileMap.height, tileMap.width)
 
-        return tileset, array
 
-
-    def decodeUnitsLayer(self, state, tileMap, layer, clsUnit=Unit):
-        tileset = self.decodeLayer(tileMap, layer)
+    def decodeUnitsLayer(self, tileMap: tmx.TileMap, layer: tmx.Layer, kind: int) -> Tuple[tmx.Tileset, list[list[int]]]:
+        gids = self.layerIds(tileMap, layer)
+        tileset = self.decodeLayer(tileMap, gids)
+        lids = self.localIds(gids, tileset)
 
         array = []
-        for y in range(tileMap.height):
-            for x in range(tileMap.width):
-                tile = layer.tiles[x + y * tileMap.width]
-                if tile.gid == 0:
-                    continue
-                lid = tile.gid - tileset.firstgid
-                
-                if lid < 0 or lid >= tileset.tilecount:
-                    raise RuntimeError("Error in {}: invalid tile id".format(self.fileName))
-
-                tileX = lid % tileMap.width
-                tileY = lid // tileMap.width
-                array.append(clsUnit(state=state, position=Vector2(x, y), tile=Vector2(tileX, tileY)))
+        for index in np.flatnonzero(lids >= 0).tolist():
+            lid = int(lids[index])
+            y, x = divmod(index, tileMap.width)
+            array.append([kind, x, y, lid % tileset.columns, lid // tileset.columns])
 
         return tileset, array
         
 
 
-    def decodeLayer(self, tileMap: tmx.TileMap, layer: tmx.Layer) -> tmx.Tileset:
-        if not isinstance(layer, tmx.Layer):
-            raise RuntimeError("Error in {}: invalid layer type".format(self.fileName))
-        if len(layer.tiles) != tileMap.width * tileMap.height:
-            raise RuntimeError("Error in {}: invalid layer size".format(self.fileName))
-
-        gid = None
-        for tile in layer.tiles:
-            if tile.gid != 0:
-                gid = tile.gid
-                break
+    def decodeLayer(self, tileMap: tmx.TileMap, gids: np.ndarray) -> tmx.Tileset:
+        used = np.flatnonzero(gids)
+        gid = int(gids[used[0]]) if len(used) > 0 else None
         if gid is None:
             if len(tileMap.tilesets) == 0:
                 raise RuntimeError("Error in {}: no tilesets".format(self.fileName))
@@ -0,0 +1,54 @@
+import numpy as np
+
+
+class EffectPool:
+    """Fixed number of animated effect slots, stored as arrays and advanced in one step per frame.
+
+    Live effects are packed at the front; spawn() drops the effect when all
+    slots are taken, so a mass kill costs at most capacity slots.
+    """
+
+    def __init__(self, capacity: int = 256, frameCount: int = 28, frameStep: float = 0.5):
+        self.count = 0
+        self.frameCount = frameCount
+        self.frameStep = frameStep
+        self.position = np.zeros((capacity, 2), dtype=np.float64)
+        self.frame = np.zeros(capacity, dtype=np.float64)
+        self.dropped = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self) -> int:
+        return len(self.frame)
+
+    def clear(self):
+        self.count = 0
+
+    def spawn(self, x: float, y: float) -> bool:
+        if self.count == self.capacity:
+            self.dropped += 1
+            return False
+        i = self.count
+        self.position[i] = (x, y)
+        self.frame[i] = 0
+        self.count += 1
+        return True
+
+    def frames(self) -> np.ndarray:
+        """Current animation frame of each live effect."""
+        return self.frame[:self.count].astype(np.intp)
+
+    def advance(self):
+        n = self.count
+        if n == 0:
+            return
+        self.frame[:n] += self.frameStep
+        keep = self.frame[:n] <= self.frameCount - 1
+        k = int(np.count_nonzero(keep))
+        if k == n:
+            return
+        self.position[:k] = self.position[:n][keep]
+        self.frame[:k] = self.frame[:n][keep]
+        self.count = k
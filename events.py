@@ -0,0 +1,92 @@
+from collections import defaultdict
+from typing import Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from unit import Unit
+    from tile_grid import ChunkedTileGrid
+
+
+class Event:
+    __slots__ = ()
+
+
+class UnitDestroyed(Event):
+    __slots__ = ('unit',)
+
+    def __init__(self, unit: "Unit"):
+        self.unit = unit
+
+
+class ShotFired(Event):
+    __slots__ = ('unit',)
+
+    def __init__(self, unit: "Unit"):
+        self.unit = unit
+
+
+class UnitMoved(Event):
+    __slots__ = ('unit', 'fromX', 'fromY')
+
+    def __init__(self, unit: "Unit", fromX: int, fromY: int):
+        self.unit = unit
+        self.fromX = fromX
+        self.fromY = fromY
+
+
+class CellChanged(Event):
+    __slots__ = ('grid', 'x', 'y')
+
+    def __init__(self, grid: "ChunkedTileGrid", x: int, y: int):
+        self.grid = grid
+        self.x = x
+        self.y = y
+
+
+class LevelLoaded(Event):
+    __slots__ = ('fileName',)
+
+    def __init__(self, fileName: str):
+        self.fileName = fileName
+
+
+class EventBus:
+    """Queues game events and hands them to subscribers in one batch per type.
+
+    Handlers are called with the list of queued events of their type, once
+    per dispatch(); events nobody subscribed to are not queued at all.
+    """
+
+    def __init__(self):
+        self.subscribers: dict[type, list[Callable[[list[Event]], None]]] = {}
+        self.queues: dict[type, list[Event]] = defaultdict(list)
+
+    def subscribe(self, eventType: type, handler: Callable[[list[Event]], None]):
+        self.subscribers.setdefault(eventType, []).append(handler)
+
+    def unsubscribe(self, eventType: type, handler: Callable[[list[Event]], None]):
+        handlers = self.subscribers.get(eventType, [])
+        if handler in handlers:
+            handlers.remove(handler)
+        if len(handlers) == 0:
+            self.subscribers.pop(eventType, None)
+            self.queues.pop(eventType, None)
+
+    def wants(self, eventType: type) -> bool:
+        return eventType in self.subscribers
+
+    def post(self, event: Event):
+        if type(event) in self.subscribers:
+            self.queues[type(event)].append(event)
+
+    def dispatch(self):
+        if len(self.queues) == 0:
+            return
+        queues = self.queues
+        # handlers may post again, those events go out with the next dispatch
+        self.queues = defaultdict(list)
+        for eventType, events in queues.items():
+            for handler in self.subscribers.get(eventType, ()):
+                handler(events)
+
+    def clear(self):
+        self.queues = defaultdict(list)
@@ -0,0 +1,81 @@
+from collections import deque
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from pygame import Vector2
+
+from tile_grid import EMPTY
+
+if TYPE_CHECKING:
+    from game_state import GameState
+
+
+# direction codes stored in the field, 0 means no way to the target
+STEPS = [None, Vector2(1, 0), Vector2(-1, 0), Vector2(0, 1), Vector2(0, -1)]
+
+
+class FlowField:
+    """Next step towards the nearest target cell for every cell within radius of the targets.
+
+    A single breadth-first search over the walls, started at all targets, is
+    shared by all pursuing units. It runs again only when a target moves to
+    another cell or the walls change; reading a unit's next step is a lookup.
+    """
+
+    def __init__(self, radius: int = 32):
+        self.radius = radius
+        self.key = None
+        self.x0 = 0
+        self.y0 = 0
+        self.directions = np.zeros((0, 0), dtype=np.int8)
+        self.distances = np.zeros((0, 0), dtype=np.int32)
+
+    def update(self, state: "GameState", targets: list[tuple[int, int]]):
+        walls = state.walls
+        key = (id(walls), walls.revision, tuple(targets), self.radius)
+        if key == self.key:
+            return
+        self.key = key
+
+        # search only the box around the targets, it bounds the cost on huge maps
+        xs, ys = [x for x, _ in targets], [y for _, y in targets]
+        x0, y0 = max(0, min(xs) - self.radius), max(0, min(ys) - self.radius)
+        x1, y1 = min(walls.width, max(xs) + self.radius + 1), min(walls.height, max(ys) + self.radius + 1)
+        free = (walls.region(x0, y0, x1, y1) == EMPTY).tolist()
+        height, width = y1 - y0, x1 - x0
+        directions = [[0] * width for _ in range(height)]
+        distances = [[-1] * width for _ in range(height)]
+
+        queue = deque()
+        for targetX, targetY in targets:
+            startX, startY = targetX - x0, targetY - y0
+            if 0 <= startX < width and 0 <= startY < height and distances[startY][startX] < 0:
+                distances[startY][startX] = 0
+                queue.append((startX, startY))
+        while queue:
+            x, y = queue.popleft()
+            distance = distances[y][x] + 1
+            # a neighbour steps back along the direction it was reached from
+            for nx, ny, code in ((x - 1, y, 1), (x + 1, y, 2), (x, y - 1, 3), (x, y + 1, 4)):
+                if 0 <= nx < width and 0 <= ny < height and free[ny][nx] and distances[ny][nx] < 0:
+                    distances[ny][nx] = distance
+                    directions[ny][nx] = code
+                    queue.append((nx, ny))
+
+        self.x0, self.y0 = x0, y0
+        self.directions = np.array(directions, dtype=np.int8)
+        self.distances = np.array(distances, dtype=np.int32)
+
+    def distance(self, x: int, y: int) -> int:
+        """Steps from (x, y) to the target, -1 if it is unreachable or out of radius."""
+        x, y = x - self.x0, y - self.y0
+        if x < 0 or y < 0 or y >= self.distances.shape[0] or x >= self.distances.shape[1]:
+            return -1
+        return int(self.distances[y, x])
+
+    def nextStep(self, x: int, y: int) -> Optional[Vector2]:
+        """Move vector from (x, y) towards the target, None if there is no way."""
+        x, y = x - self.x0, y - self.y0
+        if x < 0 or y < 0 or y >= self.directions.shape[0] or x >= self.directions.shape[1]:
+            return None
+        return STEPS[self.directions[y, x]]
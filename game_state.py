@@ -1,41 +1,24 @@
-from typing import Optional, TYPE_CHECKING
+from typing import Optional
 from pygame import Vector2
 
-from unit import Tank, Tower, Unit
+from bullet_store import BulletStore
+from unit import Tank, Tower, Unit, ALIVE
+from tile_grid import ChunkedTileGrid
+from unit_grid import UnitGrid
+from events import EventBus, CellChanged, ShotFired, UnitMoved
 
-if TYPE_CHECKING:
-    from layer import GameStateObserver
-
-
-class Notificator:
-    def __init__(self):
-        self.observers: list["GameStateObserver"] = []
-
-
-    def registerObserver(self, observer:"GameStateObserver"):
-        self.observers.append(observer)
-
-
-    def unregisterObserver(self, observer: "GameStateObserver"):
-        index = self.observers.index(observer)
-        if index != -1:
-            del self.observers[index]
-        
-    def notifyDestroyed(self, unit: Unit):
-        for observer in self.observers:
-            observer.unitDestroyed(unit)
 
 
 
-
-class GameState(Notificator):
+class GameState:
     def __init__(self):
-        super().__init__()
+        # batched per tick, see Simulation.stepPlayers
+        self.events = EventBus()
         
         self.worldSize = Vector2(16, 10)
 
         self.tankPos = Vector2(0, 0)
-        self.ground: list[list[Vector2]] = [ 
+        self.ground = ChunkedTileGrid.fromRows([
             [ Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1)],
             [ Vector2(5,1), Vector2(5,1), Vector2(7,1), Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(7,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(6,1), Vector2(5,1), Vector2(5,1), Vector2(6,4), Vector2(7,2), Vector2(7,2)],
             [ Vector2(5,1), Vector2(6,1), Vector2(5,1), Vector2(5,1), Vector2(6,1), Vector2(6,2), Vector2(5,1), Vector2(6,1), Vector2(6,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(6,1), Vector2(5,1)],
@@ -46,7 +29,7 @@ class GameState(Notificator):
             [ Vector2(5,1), Vector2(5,1), Vector2(6,4), Vector2(7,2), Vector2(7,2), Vector2(8,4), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(5,1), Vector2(5,1)],
             [ Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(5,1), Vector2(5,1), Vector2(7,1), Vector2(5,1), Vector2(5,1), Vector2(6,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(7,4), Vector2(7,2), Vector2(7,2)],
             [ Vector2(5,1), Vector2(5,1), Vector2(6,2), Vector2(6,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1), Vector2(5,1)]
-        ]
+        ], columns=16)
 
         self.units: list[Unit] = [
             Tank(self, Vector2(1, 0), Vector2(1, 0)),
@@ -54,7 +37,7 @@ class GameState(Notificator):
             Tower(self, Vector2(10, 3), Vector2(0, 1)),
         ]
 
-        self.walls: list[list[Optional[Vector2]]] = [
+        self.walls = ChunkedTileGrid.fromRows([
             [ None, None, None, None, None, None, None, None, None, Vector2(1,3), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1)],
             [ None, None, None, None, None, None, None, None, None, Vector2(2,1), None, None, None, None, None, None],
             [ None, None, None, None, None, None, None, None, None, Vector2(2,1), None, None, Vector2(1,3), Vector2(1,1), Vector2(0,3), None],
@@ -65,14 +48,19 @@ class GameState(Notificator):
             [ None, None, None, None, None, None, None, None, None, Vector2(2,1), None, None, Vector2(2,3), Vector2(1,1), Vector2(3,3), None],
             [ None, None, None, None, None, None, None, None, None, Vector2(2,1), None, None, None, None, None, None],
             [ None, None, None, None, None, None, None, None, None, Vector2(2,3), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1), Vector2(1,1)]
-        ] 
+        ], columns=16)
+
+        # occupancy index: unitGrid.get(x, y) is the unit standing on the cell
+        self.unitGrid = UnitGrid()
+        self.rebuildUnitGrid()
 
         # bullets
-        self.bullets = []
+        self.bullets = BulletStore()
         self.bulletSpeed = 2
         self.bulletRange = 5
         self.bulletDelay = 12
         self.epoch = 0
+        self.shotsFired = 0
 
 
     @property
@@ -85,18 +73,86 @@ class GameState(Notificator):
     
 
     def inside_world(self, pos: Vector2):
-        return all([
-            pos.x >= 0,
-            pos.y >= 0,
-            int(pos.x) < self.worldWidth,
-            int(pos.y) < self.worldHeight,
-        ])
+        # the tile grids know the world bounds, no cell has to be loaded for this
+        return pos.x >= 0 and pos.y >= 0 and int(pos.x) < self.walls.width and int(pos.y) < self.walls.height
     
-    def findLiveUnit(self, pos: Vector2):
-        int_pos = Vector2(int(pos.x), int(pos.y))
+    def setCell(self, grid: ChunkedTileGrid, x: int, y: int, tileId: int):
+        # ground and walls must be changed through here, so baked layers stay valid
+        grid.set(x, y, tileId)
+        self.events.post(CellChanged(grid, x, y))
+
+    def rebuildUnitGrid(self):
+        self.unitGrid.reset(self.worldWidth, self.worldHeight)
         for unit in self.units:
-            if unit.position == int_pos and unit.status == 'alive':
-                return unit
+            if 0 <= unit.x < self.worldWidth and 0 <= unit.y < self.worldHeight:
+                self.unitGrid.set(unit.x, unit.y, unit)
+
+    def unitAt(self, pos: Vector2) -> Optional[Unit]:
+        return self.unitAtCell(int(pos.x), int(pos.y))
+
+    def unitAtCell(self, x: int, y: int) -> Optional[Unit]:
+        if x < 0 or y < 0 or x >= self.worldWidth or y >= self.worldHeight:
+            return None
+        return self.unitGrid.get(x, y)
+
+    def tryMove(self, unit: Unit, dx: int, dy: int) -> bool:
+        """Moves unit by (dx, dy) cells and turns it that way, unless the border, a wall or another unit is in the way."""
+        x, y = unit.x + dx, unit.y + dy
+        if x < 0 or y < 0 or x >= self.walls.width or y >= self.walls.height:
+            return False
+
+        # Collisions with walls aren't allowed
+        if not self.walls.isEmpty(x, y):
+            return False
+
+        # Collisions with other unit aren't allowed
+        other = self.unitGrid.get(x, y)
+        if other is not None and other is not unit:
+            return False
+
+        self.moveUnitToCell(unit, x, y)
+
+        # choose orientation
+        if dx < 0:
+            unit.orientation = 90
+        elif dx > 0:
+            unit.orientation = -90
+        if dy < 0:
+            unit.orientation = 0
+        elif dy > 0:
+            unit.orientation = 180
+        return True
+
+    def moveUnit(self, unit: Unit, newPos: Vector2):
+        self.moveUnitToCell(unit, int(newPos.x), int(newPos.y))
+
+    def moveUnitToCell(self, unit: Unit, x: int, y: int):
+        if self.events.wants(UnitMoved):
+            self.events.post(UnitMoved(unit, unit.x, unit.y))
+        self.removeUnit(unit)
+        unit.x = x
+        unit.y = y
+        self.unitGrid.set(x, y, unit)
+
+    def removeUnit(self, unit: Unit):
+        self.unitGrid.remove(unit.x, unit.y, unit)
+
+    def shoot(self, unit: Unit) -> bool:
+        if unit.status != ALIVE:
+            return False
+        if self.epoch - unit.lastBulletEpoch < self.bulletDelay:
+            return False
+        unit.lastBulletEpoch = self.epoch
+        if not self.bullets.spawn(unit):
+            return False
+        self.shotsFired += 1
+        self.events.post(ShotFired(unit))
+        return True
+
+    def findLiveUnit(self, pos: Vector2):
+        unit = self.unitAt(pos)
+        if unit is not None and unit.status == ALIVE:
+            return unit
 
 
     
\ No newline at end of file
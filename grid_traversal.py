@@ -0,0 +1,89 @@
+import math
+from typing import Iterator
+
+
+# border distances closer than this count as a corner
+CORNER_EPSILON = 1e-9
+
+
+def traverseCells(x0: float, y0: float, x1: float, y1: float) -> Iterator[tuple[int, int]]:
+    """Cells crossed by the segment from (x0, y0) to (x1, y1), in order, both ends included.
+
+    Grid traversal in the style of Amanatides and Woo: one step per crossed cell
+    border. When the segment passes through a cell corner (up to CORNER_EPSILON),
+    both cells beside the corner are visited, so nothing slips between two
+    diagonal walls.
+    """
+    x, y = int(math.floor(x0)), int(math.floor(y0))
+    endX, endY = int(math.floor(x1)), int(math.floor(y1))
+    dx, dy = x1 - x0, y1 - y0
+    stepX = 1 if dx > 0 else -1
+    stepY = 1 if dy > 0 else -1
+
+    # distance along the segment (0..1) to the next vertical/horizontal border and between two of them
+    if dx != 0:
+        tDeltaX = abs(1 / dx)
+        tMaxX = ((x + 1 - x0) if dx > 0 else (x0 - x)) * tDeltaX
+    else:
+        tDeltaX = tMaxX = math.inf
+    if dy != 0:
+        tDeltaY = abs(1 / dy)
+        tMaxY = ((y + 1 - y0) if dy > 0 else (y0 - y)) * tDeltaY
+    else:
+        tDeltaY = tMaxY = math.inf
+
+    yield x, y
+    steps = abs(endX - x) + abs(endY - y)
+    while steps > 0:
+        # the border distances are sums of floats, so a corner is a near tie and not only an exact one
+        gap = tMaxX - tMaxY
+        if steps >= 2 and abs(gap) < CORNER_EPSILON:
+            # through a corner
+            yield x + stepX, y
+            yield x, y + stepY
+            x += stepX
+            y += stepY
+            tMaxX += tDeltaX
+            tMaxY += tDeltaY
+            steps -= 2
+        elif gap < 0:
+            x += stepX
+            tMaxX += tDeltaX
+            steps -= 1
+        else:
+            y += stepY
+            tMaxY += tDeltaY
+            steps -= 1
+        yield x, y
+
+
+def traverseCellCenters(x0: int, y0: int, x1: int, y1: int) -> Iterator[tuple[int, int]]:
+    """Cells crossed by the segment between the centers of cells (x0, y0) and (x1, y1).
+
+    Same walk as traverseCells, but in integer arithmetic: corners are found
+    exactly, so the cells visited do not depend on the direction of the segment.
+    """
+    x, y = x0, y0
+    stepX = 1 if x1 > x0 else -1
+    stepY = 1 if y1 > y0 else -1
+    nx, ny = abs(x1 - x0), abs(y1 - y0)
+
+    yield x, y
+    ix = iy = 0
+    while ix < nx or iy < ny:
+        # the next vertical border is at t = (ix + 0.5) / nx, the next horizontal one at (iy + 0.5) / ny
+        decision = (1 + 2 * ix) * ny - (1 + 2 * iy) * nx
+        if decision == 0:
+            yield x + stepX, y
+            yield x, y + stepY
+            x += stepX
+            y += stepY
+            ix += 1
+            iy += 1
+        elif decision < 0:
+            x += stepX
+            ix += 1
+        else:
+            y += stepY
+            iy += 1
+        yield x, y
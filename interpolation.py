@@ -0,0 +1,55 @@
+from typing import TYPE_CHECKING
+
+import numpy as np
+from pygame import Vector2
+
+if TYPE_CHECKING:
+    from game_state import GameState
+    from bullet_store import BulletStore
+    from unit import Unit
+
+
+class TickHistory:
+    """Unit and bullet positions before the last tick, to draw between two ticks.
+
+    alpha 0 is the state before the last tick, 1 the current state. Units and
+    bullets which did not exist before the last tick are drawn where they are.
+    """
+
+    def __init__(self):
+        self.units: dict["Unit", tuple[int, int, float, float]] = {}
+        self.bulletIds = np.zeros(0, dtype=np.int64)
+        self.bulletPositions = np.zeros((0, 2), dtype=np.float64)
+
+    def capture(self, state: "GameState"):
+        self.units = {unit: (unit.x, unit.y, unit.targetX, unit.targetY) for unit in state.units}
+        bullets = state.bullets
+        self.bulletIds = bullets.ids[:bullets.count].copy()
+        self.bulletPositions = bullets.position[:bullets.count].copy()
+
+    def clear(self):
+        self.units = {}
+        self.bulletIds = np.zeros(0, dtype=np.int64)
+        self.bulletPositions = np.zeros((0, 2), dtype=np.float64)
+
+    def unitPosition(self, unit: "Unit", alpha: float) -> tuple[Vector2, Vector2]:
+        """Interpolated position and weapon target of unit."""
+        previous = self.units.get(unit)
+        if previous is None or alpha >= 1:
+            return unit.position, unit.weaponTarget
+        x, y, targetX, targetY = previous
+        return Vector2(x + (unit.x - x) * alpha, y + (unit.y - y) * alpha), \
+            Vector2(targetX + (unit.targetX - targetX) * alpha, targetY + (unit.targetY - targetY) * alpha)
+
+    def bulletPositionsAt(self, bullets: "BulletStore", alpha: float) -> np.ndarray:
+        positions = bullets.positions()
+        if alpha >= 1 or len(self.bulletIds) == 0 or len(positions) == 0:
+            return positions
+        # ids grow with every shot and compaction keeps the order, so both id arrays are sorted
+        ids = bullets.ids[:bullets.count]
+        index = np.minimum(np.searchsorted(self.bulletIds, ids), len(self.bulletIds) - 1)
+        known = self.bulletIds[index] == ids
+        result = positions.copy()
+        previous = self.bulletPositions[index[known]]
+        result[known] = previous + (positions[known] - previous) * alpha
+        return result
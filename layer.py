@@ -1,31 +1,115 @@
 import math
+from collections import OrderedDict
 
+import numpy as np
 import pygame
 from pygame import Vector2
 
-from typing import TYPE_CHECKING
+from typing import Optional, TYPE_CHECKING, Tuple
+
+from assets import assets
+from tile_grid import EMPTY
+from events import EventBus, CellChanged, UnitDestroyed
+from effects import EffectPool
+
+
+# layers bigger than this (in pixels per side) are not baked, the cache would not fit in memory
+MAX_BAKED_SIZE = 4096
 
 if TYPE_CHECKING:
     from user_interface import UserInterface
-    from unit import Unit, Bullet
+    from unit import Unit
     from game_state import GameState
+    from bullet_store import BulletStore
+    from tile_grid import ChunkedTileGrid
+
+
+class RotationCache:
+    """LRU cache of rotated sprites keyed by (texture, tile, quantized angle)."""
+
+    def __init__(self, angleStep: float = 3, maxSize: int = 512):
+        self.angleStep = angleStep
+        self.maxSize = maxSize
+        self.sprites: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, angle: float) -> float:
+        if self.angleStep <= 0:
+            return angle % 360
+        return (round(angle / self.angleStep) * self.angleStep) % 360
+
+    def get(self, texture: pygame.Surface, textureRect: pygame.Rect, angle: float) -> Tuple[pygame.Surface, Vector2]:
+        angle = self.quantize(angle)
+        key = (texture, textureRect.x, textureRect.y, textureRect.w, textureRect.h, angle)
+        entry = self.sprites.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return entry
+        
+        self.misses += 1
 
+        # extract image on isolate Surface
+        textureTile = pygame.Surface(textureRect.size, pygame.SRCALPHA)
+        textureTile.blit(texture, (0, 0), textureRect)
 
-class GameStateObserver:
-    def unitDestroyed(self, unit):
-        pass
+        # rotate image
+        rotatedTile = pygame.transform.rotate(textureTile, angle)
+
+        # calculate position
+        dx = (rotatedTile.get_width() - textureTile.get_width()) // 2
+        dy = (rotatedTile.get_height() - textureTile.get_height()) // 2
+
+        entry = (rotatedTile, Vector2(dx, dy))
+        self.sprites[key] = entry
+        if len(self.sprites) > self.maxSize:
+            self.sprites.popitem(last=False)
+        return entry
 
+    def clear(self):
+        self.sprites.clear()
+        self.hits = 0
+        self.misses = 0
 
+    @property
+    def hitRate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+
+
+class Layer:
+    # static layers only change on level load or through GameState.setCell
+    static = False
 
-class Layer(GameStateObserver):
     def __init__(self, ui: "UserInterface", imageFile: str):
-        super().__init__()
         self.ui = ui
-        self.texture = pygame.image.load(imageFile)
         self.imageFile = imageFile
-
-    def renderTile(self, surface: pygame.Surface, position: Vector2, tile: Vector2, angle=None):
-        spritePos = position.elementwise() * self.ui.cellSize
+        assets.load(imageFile)
+
+        # screen rects blitted during the current and the previous frame
+        self.trackRects = False
+        self.drawnRects: list[pygame.Rect] = []
+        self.previousRects: list[pygame.Rect] = []
+
+    @property
+    def texture(self) -> pygame.Surface:
+        # looked up on use, so layers pick up textures converted after a display mode change
+        return assets.load(self.imageFile)
+
+    def beginFrame(self):
+        self.previousRects = self.drawnRects
+        self.drawnRects = []
+
+    def dirtyRects(self) -> list[pygame.Rect]:
+        return self.previousRects + self.drawnRects
+
+    def renderTile(self, surface: pygame.Surface, position: Vector2, tile: Vector2, angle=None, offset: Vector2 = None):
+        # position is in cells; offset is the world pixel drawn at the surface origin (the camera by default)
+        if offset is None:
+            offset = self.ui.camera.offset
+        spritePos = position.elementwise() * self.ui.cellSize - offset
         texturePos = tile.elementwise() * self.ui.cellSize
         textureRect = pygame.Rect(
             int(texturePos.x),
@@ -34,47 +118,108 @@ class Layer(GameStateObserver):
             int(self.ui.cellSize.y)
         )
         if angle is None:
-            surface.blit(self.texture, spritePos, textureRect)
+            rect = surface.blit(self.texture, spritePos, textureRect)
         else:
-            # extract image on isolate Surface
-            textureTile = pygame.Surface((self.ui.cellWidth, self.ui.cellHeight), pygame.SRCALPHA)
-            textureTile.blit(self.texture, (0, 0), textureRect)
-
-            # rotate image
-            rotatedTile = pygame.transform.rotate(textureTile, angle)
-
-            # calculate position
-            dx = (rotatedTile.get_width() - textureTile.get_width()) // 2
-            dy = (rotatedTile.get_height() - textureTile.get_height()) // 2
-            spritePos = spritePos - Vector2(dx, dy)
-
-            surface.blit(rotatedTile, spritePos)
+            rotatedTile, rotationOffset = self.ui.rotationCache.get(self.texture, textureRect, angle)
+            rect = surface.blit(rotatedTile, spritePos - rotationOffset)
+        if self.trackRects:
+            self.drawnRects.append(rect)
         
 
     def render(self, surface: pygame.Surface):
         NotImplemented
 
     
+    def subscribe(self, events: EventBus):
+        """Registers the handlers of the game events this layer draws."""
+        pass
+
+    def tick(self):
+        """Advances animations by one simulation tick; frames in between only draw."""
+        pass
+
     def setTileset(self, cellSize, imageFile):
-        self.texture = pygame.image.load(imageFile)
         self.imageFile = imageFile
+        assets.load(imageFile)
 
 
 
 
 class ArrayLayer(Layer):
-    def __init__(self, ui: "UserInterface", imageFile: str, gameState: "GameState", array: list[list[Vector2]]):
+    static = True
+
+    def __init__(self, ui: "UserInterface", imageFile: str, gameState: "GameState", array: "ChunkedTileGrid", baked=True):
         super().__init__(ui, imageFile)
         self.array = array
         self.gameState = gameState
 
+        # static layers are composited once into an off-screen surface
+        self.baked = baked
+        self.cache: Optional[pygame.Surface] = None
+        self.cacheRevision = 0              # array revision the cache shows
+        self.invalidations = 0
+
+    @property
+    def revision(self) -> tuple[int, int]:
+        # the array can also be replaced as a whole, e.g. when a snapshot is restored
+        return self.invalidations, self.array.revision
+
+    def invalidate(self):
+        self.cache = None
+        self.invalidations += 1
+
+    def canBake(self) -> bool:
+        size = self.gameState.worldSize.elementwise() * self.ui.cellSize
+        return self.baked and size.x <= MAX_BAKED_SIZE and size.y <= MAX_BAKED_SIZE
+
+    def bake(self):
+        size = self.gameState.worldSize.elementwise() * self.ui.cellSize
+        cache = pygame.Surface((int(size.x), int(size.y)), pygame.SRCALPHA)
+        if pygame.display.get_surface() is not None:
+            cache = cache.convert_alpha()
+        self.renderCells(cache, Vector2(0, 0), 0, 0, self.gameState.worldWidth, self.gameState.worldHeight)
+        self.cache = cache
+        self.cacheRevision = self.array.revision
+
+    def renderCells(self, surface: pygame.Surface, offset: Vector2, x0: int, y0: int, x1: int, y1: int):
+        ids = self.array.region(x0, y0, x1, y1)
+        for y, x in zip(*np.nonzero(ids != EMPTY)):
+            tile = self.array.tile(int(ids[y, x]))
+            self.renderTile(surface, Vector2(x0 + int(x), y0 + int(y)), tile, offset=offset)
+
     def render(self,surface: pygame.Surface):
-        for y in range(self.gameState.worldHeight):
-            for x in range(self.gameState.worldWidth):
-                tile = self.array[y][x]
-                if tile is not None:
-                    # self.renderTile(self.ui.window, Vector2(x, y), tile)
-                    self.renderTile(surface, Vector2(x, y), tile)
+        camera = self.ui.camera
+        if not self.canBake():
+            # draw only the cells inside the view
+            self.renderCells(surface, camera.offset, *camera.visibleCells())
+            return
+        if self.cache is None or self.cacheRevision != self.array.revision:
+            self.bake()
+        surface.blit(self.cache, -camera.offset)
+
+    def setTileset(self, cellSize, imageFile):
+        super().setTileset(cellSize, imageFile)
+        self.invalidate()
+
+    def subscribe(self, events: EventBus):
+        events.subscribe(CellChanged, self.cellsChanged)
+
+    def cellsChanged(self, events: list[CellChanged]):
+        changes = [event for event in events if event.grid is self.array]
+        if len(changes) == 0 or self.cache is None:
+            return
+        if self.cacheRevision != self.array.revision - len(changes):
+            return      # the grid also changed in other ways, render() bakes it again
+
+        # redraw only the changed cells of the cache
+        for event in changes:
+            x, y = event.x, event.y
+            cellRect = pygame.Rect(x * self.ui.cellWidth, y * self.ui.cellHeight, self.ui.cellWidth, self.ui.cellHeight)
+            self.cache.fill((0, 0, 0, 0), cellRect)
+            tile = self.array.tileAt(x, y)
+            if tile is not None:
+                self.renderTile(self.cache, Vector2(x, y), tile, offset=Vector2(0, 0))
+        self.cacheRevision = self.array.revision
 
     
 
@@ -88,50 +233,93 @@ class UnitsLayer(Layer):
 
 
     def render(self, surface: pygame.Surface):
-        for unit in self.units:
+        # units inside the view (plus one cell for rotated sprites), from the occupancy index
+        x0, y0, x1, y1 = self.ui.camera.visibleCells()
+        cells = self.gameState.unitGrid.region(x0 - 1, y0 - 1, x1 + 1, y1 + 1)
+        history, alpha = self.ui.history, self.ui.alpha
+        for unit in cells[cells != None].tolist():
+            position, weaponTarget = history.unitPosition(unit, alpha)
             # self.renderTile(self.ui.window, unit.position, unit.tile, unit.orientation)
-            self.renderTile(surface, unit.position, unit.tile, unit.orientation)
-            target = unit.weaponTarget - unit.position
+            self.renderTile(surface, position, unit.tile, unit.orientation)
+            target = weaponTarget - position
             angle = math.atan2(-target.x, -target.y) * 180 / math.pi
 
             # self.renderTile(self.ui.window, unit.position, Vector2(0, 6), angle)
-            self.renderTile(surface, unit.position, Vector2(0, 6), angle)
+            self.renderTile(surface, position, Vector2(0, 6), angle)
 
 
 class BulletLayer(Layer):
-    def __init__(self, ui: "UserInterface", imageFile: str, gameState: "GameState", bullets: list["Bullet"]):
+    def __init__(self, ui: "UserInterface", imageFile: str, gameState: "GameState", bullets: "BulletStore"):
         super().__init__(ui, imageFile)
         self.bullets = bullets
         self.gameState = gameState
 
     def render(self, surface: pygame.Surface):
-        for bullet in self.bullets:
-            # self.renderTile(self.ui.window, bullet.position, bullet.tile)
-            self.renderTile(surface, bullet.position, bullet.tile)
+        # all bullets share one tile, so they are submitted as a single batch
+        texturePos = self.bullets.tile.elementwise() * self.ui.cellSize
+        textureRect = pygame.Rect(int(texturePos.x), int(texturePos.y), self.ui.cellWidth, self.ui.cellHeight)
+        cellWidth, cellHeight = self.ui.cellWidth, self.ui.cellHeight
+        offsetX, offsetY = self.ui.camera.offset
+
+        # bullets inside the view
+        x0, y0, x1, y1 = self.ui.camera.visibleCells()
+        positions = self.ui.history.bulletPositionsAt(self.bullets, self.ui.alpha)
+        visible = (positions[:, 0] > x0 - 1) & (positions[:, 0] < x1) \
+            & (positions[:, 1] > y0 - 1) & (positions[:, 1] < y1)
+        rects = surface.blits([
+            (self.texture, (x * cellWidth - offsetX, y * cellHeight - offsetY), textureRect)
+            for x, y in positions[visible].tolist()
+        ])
+        if self.trackRects:
+            self.drawnRects.extend(rects)
 
 
 class ExplosionsLayer(Layer):
-    def __init__(self, ui: "UserInterface", imageFile: str):
+    def __init__(self, ui: "UserInterface", imageFile: str, maxEffects: int = 256):
         super().__init__(ui, imageFile)
-        self.explosions = []
-        self.maxFrameIndex = 27
+        self.effects = EffectPool(maxEffects, frameCount=28)
+        self.frameRects: list[pygame.Rect] = []
+
+    def setTileset(self, cellSize, imageFile):
+        super().setTileset(cellSize, imageFile)
+        self.frameRects = []
 
     def add(self, position: Vector2):
-        self.explosions.append({
-            'position': position,
-            'frameIndex': 0
-        })
+        self.effects.spawn(position.x, position.y)
 
     def render(self, surface: pygame.Surface):
-        for explosion in self.explosions:
-            frameIndex = int(explosion['frameIndex'])
-            self.renderTile(surface, explosion['position'], Vector2(frameIndex, 4))
-            explosion['frameIndex'] += 0.5
-
-        self.explosions = [ex for ex in self.explosions if ex['frameIndex'] <= self.maxFrameIndex]
-    
-    def unitDestroyed(self, unit: "Unit"):
-        self.add(unit.position)
+        effects = self.effects
+        if len(effects) == 0:
+            return
+        cellWidth, cellHeight = self.ui.cellWidth, self.ui.cellHeight
+        if len(self.frameRects) == 0:
+            # the explosion animation is row 4 of the tileset
+            self.frameRects = [pygame.Rect(index * cellWidth, 4 * cellHeight, cellWidth, cellHeight)
+                               for index in range(effects.frameCount)]
+        offsetX, offsetY = self.ui.camera.offset
+
+        x0, y0, x1, y1 = self.ui.camera.visibleCells()
+        positions = effects.position[:effects.count]
+        visible = (positions[:, 0] > x0 - 1) & (positions[:, 0] < x1) \
+            & (positions[:, 1] > y0 - 1) & (positions[:, 1] < y1)
+        texture = self.texture
+        frameRects = self.frameRects
+        rects = surface.blits([
+            (texture, (x * cellWidth - offsetX, y * cellHeight - offsetY), frameRects[frame])
+            for (x, y), frame in zip(positions[visible].tolist(), effects.frames()[visible].tolist())
+        ])
+        if self.trackRects:
+            self.drawnRects.extend(rects)
+
+    def tick(self):
+        self.effects.advance()
+
+    def subscribe(self, events: EventBus):
+        events.subscribe(UnitDestroyed, self.unitsDestroyed)
+
+    def unitsDestroyed(self, events: list[UnitDestroyed]):
+        for event in events:
+            self.add(event.unit.position)
 
 
 
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+
+MAGIC = b'TKLV'
+VERSION = 2
+ALIGNMENT = 64
+
+# kinds stored in CompiledLevel.units[:, 0]
+TANK = 0
+TOWER = 1
+
+
+class CompiledLevel:
+    """Dense, pre-validated form of a .tmx level.
+
+    ground and walls hold local tile ids (-1 for an empty cell), units holds
+    one (kind, x, y, tileX, tileY) row per unit in load order. Image paths are
+    relative to the directory of the source map.
+    """
+
+    def __init__(self, width: int, height: int, cellSize: tuple[int, int], images: dict[str, str],
+                 groundColumns: int, wallsColumns: int,
+                 ground: np.ndarray, walls: np.ndarray, units: np.ndarray):
+        self.width = width
+        self.height = height
+        self.cellSize = cellSize
+        self.images = images
+        self.groundColumns = groundColumns
+        self.wallsColumns = wallsColumns
+        self.ground = ground
+        self.walls = walls
+        self.units = units
+
+
+    def save(self, fileName: str):
+        arrays = {'ground': self.ground, 'walls': self.walls, 'units': self.units}
+        header = {
+            'width': self.width,
+            'height': self.height,
+            'cellSize': list(self.cellSize),
+            'images': self.images,
+            'groundColumns': self.groundColumns,
+            'wallsColumns': self.wallsColumns,
+            'arrays': {},
+        }
+
+        # array offsets depend on the header size, so lay it out with placeholders first
+        for name, array in arrays.items():
+            header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': 0}
+        headerSize = len(json.dumps(header).encode()) + 32 * len(arrays)
+        offset = align(12 + headerSize)
+        for name, array in arrays.items():
+            header['arrays'][name]['offset'] = offset
+            offset = align(offset + array.nbytes)
+
+        data = json.dumps(header).encode()
+        if len(data) > headerSize:
+            raise RuntimeError("Error in {}: header does not fit".format(fileName))
+        data = data.ljust(headerSize)
+        tmpName = fileName + '.tmp'
+        with open(tmpName, 'wb') as file:
+            file.write(MAGIC + struct.pack('<II', VERSION, len(data)) + data)
+            for name, array in arrays.items():
+                file.seek(header['arrays'][name]['offset'])
+                file.write(np.ascontiguousarray(array).tobytes())
+        os.replace(tmpName, fileName)
+
+
+    @classmethod
+    def load(cls, fileName: str, mmap: bool = True) -> "CompiledLevel":
+        with open(fileName, 'rb') as file:
+            magic = file.read(4)
+            if magic != MAGIC:
+                raise RuntimeError("Error in {}: not a compiled level".format(fileName))
+            version, headerSize = struct.unpack('<II', file.read(8))
+            if version != VERSION:
+                raise RuntimeError("Error in {}: unsupported version {}".format(fileName, version))
+            header = json.loads(file.read(headerSize))
+
+        arrays = {}
+        for name, info in header['arrays'].items():
+            shape = tuple(info['shape'])
+            if not all(shape):
+                arrays[name] = np.zeros(shape, dtype=info['dtype'])
+            elif mmap:
+                arrays[name] = np.memmap(fileName, dtype=info['dtype'], mode='r', offset=info['offset'], shape=shape)
+            else:
+                count = int(np.prod(shape))
+                arrays[name] = np.fromfile(fileName, dtype=info['dtype'], count=count, offset=info['offset']).reshape(shape)
+
+        return cls(
+            header['width'], header['height'], tuple(header['cellSize']), header['images'],
+            header['groundColumns'], header['wallsColumns'],
+            arrays['ground'], arrays['walls'], arrays['units'],
+        )
+
+
+def align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def cachePath(fileName: str, cacheDir: str = None) -> str:
+    """Compiled level path for fileName, keyed by a hash of its content."""
+    if cacheDir is None:
+        cacheDir = os.path.join(os.path.dirname(fileName), '__levelcache__')
+    with open(fileName, 'rb') as file:
+        digest = hashlib.sha1(file.read()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(fileName))[0]
+    return os.path.join(cacheDir, '{}-{}-v{}.lvl'.format(stem, digest, VERSION))
@@ -0,0 +1,91 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import pygame
+
+from assets import assets
+from command import DecodeLevelCommand
+from level_cache import CompiledLevel
+
+
+class PreparedLevel:
+    """A compiled level and its decoded tileset images, ready to be applied without any file access."""
+
+    def __init__(self, fileName: str, level: CompiledLevel, images: dict[str, pygame.Surface]):
+        self.fileName = fileName
+        self.level = level
+        self.images = images
+
+    def install(self):
+        # conversion to the display format needs the main thread, so it happens here and not in the worker
+        for path, image in self.images.items():
+            assets.add(path, image)
+
+
+class LevelLoader:
+    """Prepares levels on a worker thread and keeps the last maxLevels of them.
+
+    request() starts preparing a level in the background; progress() and
+    ready() can be polled every frame, get() hands out the PreparedLevel.
+    """
+
+    def __init__(self, maxLevels: int = 4):
+        self.maxLevels = maxLevels
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='LevelLoader')
+        self.levels: OrderedDict[str, Future] = OrderedDict()
+        self.progresses: dict[str, float] = {}
+
+    def request(self, fileName: str) -> Future:
+        future = self.levels.get(fileName)
+        if future is not None and not (future.done() and future.exception() is not None):
+            self.levels.move_to_end(fileName)
+            return future
+
+        # failed levels are tried again, the file may have been fixed meanwhile
+        self.progresses[fileName] = 0.0
+        future = self.executor.submit(self.prepare, fileName)
+        self.levels[fileName] = future
+        while len(self.levels) > self.maxLevels:
+            oldName, oldFuture = self.levels.popitem(last=False)
+            oldFuture.cancel()
+            self.progresses.pop(oldName, None)
+        return future
+
+    def progress(self, fileName: str) -> float:
+        return self.progresses.get(fileName, 0.0)
+
+    def ready(self, fileName: str) -> bool:
+        future = self.levels.get(fileName)
+        return future is not None and future.done()
+
+    def error(self, fileName: str) -> Optional[BaseException]:
+        future = self.levels.get(fileName)
+        if future is None or not future.done() or future.cancelled():
+            return None
+        return future.exception()
+
+    def get(self, fileName: str, timeout: float = None) -> PreparedLevel:
+        """Prepared level of fileName; waits for the worker if it is not done yet."""
+        return self.request(fileName).result(timeout)
+
+    def prepare(self, fileName: str) -> PreparedLevel:
+        # runs on the worker thread
+        if not os.path.exists(fileName):
+            raise RuntimeError('No such file {}'.format(fileName))
+        level = DecodeLevelCommand(None, fileName).loadLevel()
+
+        mapDir = os.path.dirname(fileName)
+        paths = sorted(set(os.path.join(mapDir, image) for image in level.images.values()))
+        steps = len(paths) + 1
+        self.progresses[fileName] = 1 / steps
+
+        images = {}
+        for index, path in enumerate(paths):
+            images[path] = pygame.image.load(path)
+            self.progresses[fileName] = (index + 2) / steps
+        return PreparedLevel(fileName, level, images)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,6 +1,30 @@
+import argparse
+
 from user_interface import UserInterface
+from menu import Menu
 
 
 if __name__ == '__main__':
-    game = UserInterface()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--level', help='start this .tmx level right away instead of showing the menu')
+    parser.add_argument('--record', help='write the session inputs to this replay file')
+    parser.add_argument('--replay', help='play a replay file back in real time')
+    parser.add_argument('--tick-rate', type=int, default=30, help='simulation ticks per second')
+    parser.add_argument('--max-fps', type=int, default=0, help='frame rate limit, 0 renders as fast as possible')
+    parser.add_argument('--dirty-rects', action='store_true', help='redraw and flush only the changed screen regions')
+    parser.add_argument('--profile', action='store_true', help='time the frame phases, F3 toggles the overlay')
+    parser.add_argument('--profile-dump', metavar='PATH', help='write the frame timings to this .json or .csv file on exit')
+    args = parser.parse_args()
+
+    level = None
+    if args.level is None and args.replay is None:
+        menu = Menu()
+        menu.run()
+        if menu.level is None:
+            raise SystemExit
+        level = menu.level
+
+    game = UserInterface(dirtyRects=args.dirty_rects, profile=args.profile, profileDump=args.profile_dump,
+                         record=args.record, replay=args.replay, tickRate=args.tick_rate, maxFps=args.max_fps,
+                         levelFile=args.level, level=level)
+    game.run()
@@ -1,5 +1,12 @@
-import pygame
+import glob
+import os
+import re
 from os.path import join
+from typing import Optional
+
+import pygame
+
+from level_loader import LevelLoader, PreparedLevel
 
 
 class Menu:
@@ -14,19 +21,21 @@ class Menu:
         self.itemFont = pygame.font.Font(join('fonts', 'big-shot.ttf'), 30)
         self.menuItem = [
             {
-                'action': lambda: self.load_level(join('maps', 'level1.tmx')),
-                'title': 'Level 1' 
-            },
-            
-            {
-                'action': lambda: self.load_level(join('maps', 'level2.tmx')),
-                'title': 'Level 2' 
-            },
-            {
-                'action': lambda: self.exit_menu(),
-                'title': 'Quit' 
+                'action': lambda fileName=fileName: self.load_level(fileName),
+                'title': levelTitle(fileName),
+                'fileName': fileName
             }
+            for fileName in sorted(glob.glob(join('maps', '*.tmx')))
         ]
+        self.menuItem.append({
+            'action': lambda: self.exit_menu(),
+            'title': 'Quit' 
+        })
+
+        # the highlighted level is prepared in the background, Enter only waits for what is left
+        self.loader = LevelLoader()
+        self.startFile: Optional[str] = None
+        self.level: Optional[PreparedLevel] = None
         
         self.currentMenuItem = 0
         self.menuCursor = pygame.image.load(join('images','cursor.png'))
@@ -37,13 +46,22 @@ class Menu:
 
         self.running = True
         self.clock = pygame.time.Clock()
+        self.preload()
+
+    def preload(self):
+        fileName = self.menuItem[self.currentMenuItem].get('fileName')
+        if fileName is not None:
+            self.loader.request(fileName)
 
     def load_level(self, fileName):
         print('{} is loading...'.format(fileName))
+        self.loader.request(fileName)
+        self.startFile = fileName
         
 
     def exit_menu(self):
         print('Window is closing...')
+        self.running = False
 
     def processInput(self):
         for event in pygame.event.get():
@@ -54,8 +72,10 @@ class Menu:
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_UP:
                     self.currentMenuItem = max(0, self.currentMenuItem - 1)
+                    self.preload()
                 elif event.key == pygame.K_DOWN:
                     self.currentMenuItem = min(len(self.menuItem) - 1, self.currentMenuItem + 1)
+                    self.preload()
                 elif event.key == pygame.K_RETURN:
                     menuItem = self.menuItem[self.currentMenuItem]
                     try:
@@ -68,7 +88,16 @@ class Menu:
                 
 
     def update(self):
-        pass
+        fileName = self.startFile
+        if fileName is None or not self.loader.ready(fileName):
+            return
+        self.startFile = None
+        error = self.loader.error(fileName)
+        if error is not None:
+            print(error)
+            return
+        self.level = self.loader.get(fileName)
+        self.running = False
 
     def render(self):
         self.window.fill('black')
@@ -96,6 +125,8 @@ class Menu:
                 cursorX = x - self.menuCursor.get_width() - 10
                 cursorY = y
                 self.window.blit(self.menuCursor, (cursorX, cursorY))
+                if 'fileName' in item:
+                    self.renderProgress(item['fileName'], x + widthItem + 20, y, item['surface'].get_height())
 
             y += (item['surface'].get_height() * 120) // 100
 
@@ -103,6 +134,19 @@ class Menu:
 
         pygame.display.update()
 
+    def renderProgress(self, fileName, x, y, itemHeight):
+        if self.loader.error(fileName) is not None:
+            color = (100, 100, 100)
+        elif self.loader.ready(fileName):
+            color = (0, 160, 0)
+        else:
+            color = (200, 0, 0)
+        height = itemHeight // 3
+        rect = pygame.Rect(x, y + height, 120, height)
+        pygame.draw.rect(self.window, color, rect, 1)
+        rect.width = int(rect.width * self.loader.progress(fileName))
+        pygame.draw.rect(self.window, color, rect)
+
 
     def run(self):
         while self.running:
@@ -110,8 +154,15 @@ class Menu:
             self.update()
             self.render()
             self.clock.tick(30)
+        self.loader.close()
         # pygame.quit()
 
+
+def levelTitle(fileName: str) -> str:
+    """'maps/level3.tmx' -> 'Level 3'"""
+    name = os.path.splitext(os.path.basename(fileName))[0]
+    return re.sub(r'(\d+)', r' \1', name).capitalize()
+
     
 
 if __name__ == '__main__':
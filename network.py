@@ -0,0 +1,411 @@
+"""Authoritative match server and headless client over asyncio streams.
+
+The server owns the Simulation and steps it at a fixed tick rate with the
+latest input of every connected player. After each tick it broadcasts one
+update holding only what changed: units whose state differs from the last
+update, bullets fired or removed since then, and destroyed units. Clients
+move bullets on their own between updates.
+
+    python network.py server --level maps/level3.tmx --port 8765
+    python network.py bots --port 8765 --count 4
+    python network.py selftest --count 3 --ticks 300
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import asyncio
+import random
+import struct
+import time
+from collections import deque
+from typing import Optional
+
+import numpy as np
+from pygame import Vector2
+
+import level_cache
+from events import UnitDestroyed
+from simulation import Simulation, PlayerInput
+from unit import Tank, Unit, ALIVE
+
+
+LENGTH = struct.Struct('<I')
+
+# client to server
+INPUT = struct.Struct('<cbbBff')                # 'I', moveX, moveY, flags, targetX, targetY
+
+# server to client
+WELCOME = struct.Struct('<cIfH')                # 'W', player unit id, bulletSpeed, length of the level file name
+UPDATE = struct.Struct('<cIHHHHH')              # 'U', epoch, changed units, removed units, new bullets, removed bullets, destroyed units
+UNIT = struct.Struct('<IBhhhBff')               # id, kind, x, y, orientation, status, targetX, targetY
+BULLET = struct.Struct('<Iffff')                # id, x, y, directionX, directionY
+ID = struct.Struct('<I')
+END = struct.Struct('<cH')                      # 'E', length of the winner
+REFUSED = struct.Struct('<cH')                  # 'X', length of the reason
+
+
+def frame(payload: bytes) -> bytes:
+    return LENGTH.pack(len(payload)) + payload
+
+
+async def readFrame(reader: asyncio.StreamReader) -> bytes:
+    size, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    return await reader.readexactly(size)
+
+
+class DestroyedEvents:
+    def __init__(self):
+        self.units: list[Unit] = []
+
+    def unitsDestroyed(self, events: list[UnitDestroyed]):
+        self.units.extend(event.unit for event in events)
+
+
+class ServerPlayer:
+    def __init__(self, unit: Unit, writer: asyncio.StreamWriter):
+        self.unit = unit
+        self.writer = writer
+        self.input: Optional[PlayerInput] = None
+        self.task = asyncio.current_task()
+
+    def merge(self, playerInput: PlayerInput):
+        # several inputs can arrive between two ticks
+        if self.input is None:
+            self.input = playerInput
+        else:
+            self.input.merge(playerInput)
+
+
+class GameServer:
+    def __init__(self, levelFile: str, tickRate: int = 30):
+        self.levelFile = levelFile
+        self.tickRate = tickRate
+        self.simulation = Simulation()
+        self.simulation.loadLevel(levelFile)
+        self.events = DestroyedEvents()
+        self.simulation.state.events.subscribe(UnitDestroyed, self.events.unitsDestroyed)
+
+        self.players: dict[Unit, ServerPlayer] = {}
+        self.unitIds: dict[Unit, int] = {}
+        self.sentUnits: dict[int, tuple] = {}       # what clients know, as of the last update
+        self.sentBullets = np.zeros(0, dtype=np.int64)
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.bytesSent = 0
+        self.tickTime = 0.0
+
+    def unitId(self, unit: Unit) -> int:
+        unitId = self.unitIds.get(unit)
+        if unitId is None:
+            unitId = self.unitIds[unit] = len(self.unitIds) + 1
+        return unitId
+
+    def unitRecords(self) -> dict[int, tuple]:
+        return {
+            self.unitId(unit): (level_cache.TANK if isinstance(unit, Tank) else level_cache.TOWER,
+                                unit.x, unit.y, int(unit.orientation), unit.status, unit.targetX, unit.targetY)
+            for unit in self.simulation.state.units
+        }
+
+    def encodeUpdate(self, units: dict[int, tuple], removedUnits: list[int], bulletIndex: np.ndarray,
+                     removedBullets: np.ndarray, destroyed: list[int]) -> bytes:
+        store = self.simulation.state.bullets
+        parts = [UPDATE.pack(b'U', self.simulation.state.epoch, len(units), len(removedUnits),
+                             len(bulletIndex), len(removedBullets), len(destroyed))]
+        parts.extend(UNIT.pack(unitId, *record) for unitId, record in units.items())
+        parts.extend(ID.pack(unitId) for unitId in removedUnits)
+        for i in bulletIndex.tolist():
+            parts.append(BULLET.pack(int(store.ids[i]), *store.position[i], *store.direction[i]))
+        parts.extend(ID.pack(bulletId) for bulletId in removedBullets.tolist())
+        parts.extend(ID.pack(unitId) for unitId in destroyed)
+        return frame(b''.join(parts))
+
+    def fullUpdate(self) -> bytes:
+        """Everything clients know, for a player joining between two ticks."""
+        store = self.simulation.state.bullets
+        known = np.flatnonzero(np.isin(store.ids[:store.count], self.sentBullets))
+        return self.encodeUpdate(self.sentUnits, [], known, np.zeros(0, dtype=np.int64), [])
+
+    def deltaUpdate(self) -> bytes:
+        units = self.unitRecords()
+        changed = {unitId: record for unitId, record in units.items() if self.sentUnits.get(unitId) != record}
+        removed = [unitId for unitId in self.sentUnits if unitId not in units]
+        self.sentUnits = units
+
+        # bullet ids only grow, live ones above the last known are new
+        store = self.simulation.state.bullets
+        ids = store.ids[:store.count][store.alive[:store.count]]
+        lastId = self.sentBullets.max() if len(self.sentBullets) else -1
+        newBullets = np.flatnonzero(store.alive[:store.count] & (store.ids[:store.count] > lastId))
+        removedBullets = np.setdiff1d(self.sentBullets, ids, assume_unique=True)
+        self.sentBullets = ids.copy()
+
+        destroyed = [self.unitId(unit) for unit in self.events.units]
+        self.events.units.clear()
+        return self.encodeUpdate(changed, removed, newBullets, removedBullets, destroyed)
+
+    def broadcast(self, data: bytes):
+        for player in list(self.players.values()):
+            if player.writer.is_closing():
+                continue
+            player.writer.write(data)
+            self.bytesSent += len(data)
+
+    def spawnUnit(self) -> Unit:
+        """The level's tank for the first player, a new tank on the nearest free cell for the others."""
+        simulation = self.simulation
+        if len(self.players) == 0:
+            return simulation.playerUnit
+        state = simulation.state
+        start = (simulation.playerUnit.x, simulation.playerUnit.y)
+        queue, seen = deque([start]), {start}
+        while queue:
+            x, y = queue.popleft()
+            if state.walls.isEmpty(x, y) and state.unitAtCell(x, y) is None:
+                unit = Tank(state, Vector2(x, y), simulation.playerUnit.tile)
+                state.units.append(unit)
+                state.unitGrid.set(x, y, unit)
+                simulation.addPlayer(unit)
+                return unit
+            for cell in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if cell not in seen and 0 <= cell[0] < state.worldWidth and 0 <= cell[1] < state.worldHeight:
+                    seen.add(cell)
+                    queue.append(cell)
+        raise RuntimeError("Error in {}: no free cell for another player".format(self.levelFile))
+
+    async def handleClient(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            unit = self.spawnUnit()
+        except RuntimeError as error:
+            reason = str(error).encode()
+            writer.write(frame(REFUSED.pack(b'X', len(reason)) + reason))
+            writer.close()
+            return
+        player = self.players[unit] = ServerPlayer(unit, writer)
+        level = self.levelFile.encode()
+        writer.write(frame(WELCOME.pack(b'W', self.unitId(unit), self.simulation.state.bulletSpeed, len(level)) + level))
+        writer.write(self.fullUpdate())
+        try:
+            while True:
+                player.merge(PlayerInput.unpack(INPUT, await readFrame(reader)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # the tank stays in the match, idle
+            player.input = None
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8765):
+        self.server = await asyncio.start_server(self.handleClient, host, port)
+        self.sentUnits = self.unitRecords()
+
+    async def run(self, ticks: int = None):
+        """Steps the match at tickRate until it ends or ticks were played."""
+        simulation = self.simulation
+        interval = 1 / self.tickRate
+        deadline = time.perf_counter()
+        tick = 0
+        while simulation.running and (ticks is None or tick < ticks):
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - time.perf_counter()))
+
+            start = time.perf_counter()
+            inputs = []
+            for unit in simulation.players:
+                player = self.players.get(unit)
+                inputs.append(player.input if player is not None else None)
+                if player is not None:
+                    player.input = None
+            simulation.stepPlayers(inputs)
+            self.broadcast(self.deltaUpdate())
+            self.tickTime += time.perf_counter() - start
+            tick += 1
+
+        if not simulation.running:
+            winner = str(simulation.winner).encode()
+            self.broadcast(frame(END.pack(b'E', len(winner)) + winner))
+
+    async def close(self):
+        for player in self.players.values():
+            player.writer.close()
+        # the connection handlers end when their reads fail
+        await asyncio.gather(*[player.task for player in self.players.values()], return_exceptions=True)
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class GameClient:
+    """Mirror of the server's units and bullets, kept up to date by the updates."""
+
+    def __init__(self):
+        self.unitId = 0
+        self.levelFile = ''
+        self.bulletSpeed = 0.0
+        self.epoch = 0
+        self.units: dict[int, list] = {}            # id -> [kind, x, y, orientation, status, targetX, targetY]
+        self.bullets: dict[int, list[float]] = {}   # id -> [x, y, directionX, directionY]
+        self.destroyed: list[int] = []
+        self.winner: Optional[str] = None
+        self.bytesReceived = 0
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self, host: str = '127.0.0.1', port: int = 8765):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        payload = await readFrame(self.reader)
+        self.bytesReceived += LENGTH.size + len(payload)
+        if payload[:1] == b'X':
+            _, size = REFUSED.unpack_from(payload)
+            self.writer.close()
+            raise RuntimeError(payload[REFUSED.size:REFUSED.size + size].decode())
+        _, self.unitId, self.bulletSpeed, size = WELCOME.unpack_from(payload)
+        self.levelFile = payload[WELCOME.size:WELCOME.size + size].decode()
+
+    def send(self, playerInput: PlayerInput):
+        self.writer.write(frame(playerInput.pack(INPUT, b'I')))
+
+    def apply(self, payload: bytes):
+        kind = payload[:1]
+        if kind == b'E':
+            _, size = END.unpack_from(payload)
+            self.winner = payload[END.size:END.size + size].decode()
+            return
+        if kind != b'U':
+            raise RuntimeError("Error in update: unknown message {}".format(kind))
+
+        _, epoch, unitCount, removedUnitCount, bulletCount, removedBulletCount, destroyedCount = UPDATE.unpack_from(payload)
+        # known bullets fly on between updates exactly as on the server
+        if self.epoch > 0:
+            distance = self.bulletSpeed * 0.1 * (epoch - self.epoch)
+            for bullet in self.bullets.values():
+                bullet[0] += bullet[2] * distance
+                bullet[1] += bullet[3] * distance
+        self.epoch = epoch
+
+        offset = UPDATE.size
+        for _ in range(unitCount):
+            unitId, *record = UNIT.unpack_from(payload, offset)
+            self.units[unitId] = record
+            offset += UNIT.size
+        for _ in range(removedUnitCount):
+            self.units.pop(ID.unpack_from(payload, offset)[0], None)
+            offset += ID.size
+        for _ in range(bulletCount):
+            bulletId, *bullet = BULLET.unpack_from(payload, offset)
+            self.bullets[bulletId] = bullet
+            offset += BULLET.size
+        for _ in range(removedBulletCount):
+            self.bullets.pop(ID.unpack_from(payload, offset)[0], None)
+            offset += ID.size
+        for _ in range(destroyedCount):
+            self.destroyed.append(ID.unpack_from(payload, offset)[0])
+            offset += ID.size
+
+    async def receive(self):
+        """Applies updates until the server ends the match or closes the connection."""
+        try:
+            while self.winner is None:
+                payload = await readFrame(self.reader)
+                self.bytesReceived += LENGTH.size + len(payload)
+                self.apply(payload)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def close(self):
+        self.writer.close()
+
+
+async def playBot(client: GameClient, seed: int, interval: float):
+    """Random moves and shots at the nearest tower, until the match ends."""
+    rng = random.Random(seed)
+    while client.winner is None and not client.writer.is_closing():
+        me = client.units.get(client.unitId)
+        if me is None or me[4] != ALIVE:
+            return
+        moveVector = rng.choice([Vector2(1, 0), Vector2(-1, 0), Vector2(0, 1), Vector2(0, -1), Vector2(0, 0)])
+        enemies = [unit for unitId, unit in client.units.items() if unit[0] == level_cache.TOWER]
+        target = None
+        if enemies:
+            nearest = min(enemies, key=lambda unit: (unit[1] - me[1]) ** 2 + (unit[2] - me[2]) ** 2)
+            target = Vector2(nearest[1], nearest[2])
+        client.send(PlayerInput(moveVector, target, target is not None))
+        await asyncio.sleep(interval)
+
+
+async def runBots(host: str, port: int, count: int, seed: int):
+    clients = [GameClient() for _ in range(count)]
+    for client in clients:
+        await client.connect(host, port)
+    await asyncio.gather(*[client.receive() for client in clients],
+                         *[playBot(client, seed + index, 0.1) for index, client in enumerate(clients)])
+    for client in clients:
+        client.close()
+    return clients
+
+
+async def selfTest(levelFile: str, port: int, count: int, ticks: int, tickRate: int, seed: int):
+    """Server and bots on localhost; checks each client's mirror against the server."""
+    server = GameServer(levelFile, tickRate)
+    await server.start(port=port)
+    clients = [GameClient() for _ in range(count)]
+    for client in clients:
+        await client.connect(port=port)
+    receivers = [asyncio.ensure_future(client.receive()) for client in clients]
+    bots = [asyncio.ensure_future(playBot(client, seed + index, 2 / tickRate)) for index, client in enumerate(clients)]
+    await server.run(ticks)
+    await asyncio.sleep(0.2)    # let the last update arrive
+
+    expected = server.sentUnits
+    store = server.simulation.state.bullets
+    bullets = {int(bulletId): position for bulletId, position
+               in zip(store.ids[:store.count].tolist(), store.position[:store.count].tolist())}
+    ok = True
+    for index, client in enumerate(clients):
+        units = {unitId: tuple(record[:5]) for unitId, record in client.units.items()}
+        unitsOk = units == {unitId: record[:5] for unitId, record in expected.items()}
+        bulletsOk = client.bullets.keys() == bullets.keys() and all(
+            abs(client.bullets[i][0] - bullets[i][0]) < 1e-3 and abs(client.bullets[i][1] - bullets[i][1]) < 1e-3
+            for i in bullets)
+        ok = ok and unitsOk and bulletsOk
+        print('client {}: {} units, {} bullets, {:.0f} bytes/tick, in sync: {}'.format(
+            index, len(client.units), len(client.bullets), client.bytesReceived / max(1, server.simulation.state.epoch),
+            unitsOk and bulletsOk))
+
+    print('{} ticks, server {:.3f} ms/tick, winner {}'.format(
+        server.simulation.state.epoch, server.tickTime * 1000 / max(1, server.simulation.state.epoch),
+        server.simulation.winner))
+    for task in bots + receivers:
+        task.cancel()
+    await server.close()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['server', 'bots', 'selftest'])
+    parser.add_argument('--level', default=os.path.join('maps', 'level3.tmx'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--count', type=int, default=2, help='bot clients')
+    parser.add_argument('--ticks', type=int, default=300, help='ticks played by the self test')
+    parser.add_argument('--tick-rate', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mode == 'server':
+        async def serve():
+            server = GameServer(args.level, args.tick_rate)
+            await server.start(args.host, args.port)
+            await server.run()
+            await server.close()
+        asyncio.run(serve())
+    elif args.mode == 'bots':
+        asyncio.run(runBots(args.host, args.port, args.count, args.seed))
+    else:
+        if not asyncio.run(selfTest(args.level, args.port, args.count, args.ticks, args.tick_rate, args.seed)):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import csv
+import json
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Optional
+
+import pygame
+
+
+class FrameProfiler:
+    """Per-frame phase, layer, command and entity statistics kept in a ring buffer."""
+
+    def __init__(self, capacity: int = 600):
+        self.frames: deque[dict] = deque(maxlen=capacity)
+        self.current: Optional[dict] = None
+        self.frameStart = 0.0
+        self.font: Optional[pygame.font.Font] = None
+
+    def beginFrame(self, epoch: int):
+        self.current = {
+            'epoch': epoch,
+            'frame': 0.0,
+            'phases': {},
+            'layers': {},
+            'commands': Counter(),
+            'entities': {},
+        }
+        self.frameStart = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.current['phases'][name] = self.current['phases'].get(name, 0.0) + time.perf_counter() - start
+
+    @contextmanager
+    def layer(self, name: str):
+        start = time.perf_counter()
+        yield
+        self.current['layers'][name] = self.current['layers'].get(name, 0.0) + time.perf_counter() - start
+
+    def countCommands(self, commands: list):
+        counts = self.current['commands']
+        for cmd in commands:
+            counts[type(cmd).__name__] += 1
+
+    def endFrame(self, **entities: int):
+        self.current['frame'] = time.perf_counter() - self.frameStart
+        self.current['entities'] = entities
+        self.frames.append(self.current)
+        self.current = None
+
+
+    def frameTimes(self) -> list[float]:
+        return [frame['frame'] for frame in self.frames]
+
+    def percentile(self, q: float, key: str = None) -> float:
+        """q-th percentile of frame time, or of one phase or layer when key is given."""
+        if key is None:
+            values = self.frameTimes()
+        else:
+            values = [frame['phases'].get(key, frame['layers'].get(key, 0.0)) for frame in self.frames]
+        if len(values) == 0:
+            return 0.0
+        values.sort()
+        index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+        return values[index]
+
+
+    def drawOverlay(self, surface: pygame.Surface, position=(8, 8), size=(240, 64)) -> pygame.Rect:
+        if self.font is None:
+            self.font = pygame.font.Font(None, 18)
+        rect = pygame.Rect(position, size)
+        overlay = pygame.Surface(size, pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 160))
+
+        # frame time graph, one column per frame, 2 pixels per millisecond
+        times = self.frameTimes()[-size[0]:]
+        graphTop = 18
+        for x, seconds in enumerate(times):
+            height = min(size[1] - graphTop, int(seconds * 2000))
+            color = (0, 200, 0) if seconds < 1 / 30 else (220, 60, 0)
+            pygame.draw.line(overlay, color, (x, size[1] - 1), (x, size[1] - 1 - height))
+
+        text = 'frame p50 {:.1f} ms  p99 {:.1f} ms'.format(self.percentile(50) * 1000, self.percentile(99) * 1000)
+        overlay.blit(self.font.render(text, True, (255, 255, 255)), (4, 2))
+        return surface.blit(overlay, rect)
+
+
+    def rows(self) -> list[dict]:
+        rows = []
+        for frame in self.frames:
+            row = {'epoch': frame['epoch'], 'frame': frame['frame']}
+            row.update({'phase.' + name: value for name, value in frame['phases'].items()})
+            row.update({'layer.' + name: value for name, value in frame['layers'].items()})
+            row.update({'commands.' + name: value for name, value in frame['commands'].items()})
+            row.update({'entities.' + name: value for name, value in frame['entities'].items()})
+            rows.append(row)
+        return rows
+
+    def dump(self, fileName: str):
+        """Writes the buffered frames as CSV or JSON, chosen by file extension."""
+        if fileName.endswith('.csv'):
+            rows = self.rows()
+            columns = []
+            for row in rows:
+                for column in row:
+                    if column not in columns:
+                        columns.append(column)
+            with open(fileName, 'w', newline='') as file:
+                writer = csv.DictWriter(file, fieldnames=columns, restval=0)
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(fileName, 'w') as file:
+                json.dump([dict(frame, commands=dict(frame['commands'])) for frame in self.frames], file, indent=1)
@@ -0,0 +1,150 @@
+"""Recording and replay of the player's inputs.
+
+A replay holds the level file and one input per epoch, plus a hash of the
+game state every hashInterval epochs. Replaying runs the inputs through the
+same Simulation.step as the game and reports the first epoch whose state
+differs from the recording:
+
+    python replay.py session.replay
+"""
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import hashlib
+import struct
+import time
+from typing import BinaryIO, Optional
+
+from game_state import GameState
+from simulation import Simulation, PlayerInput, ScriptedController
+
+
+MAGIC = b'TKRP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHH')        # magic, version, hashInterval, length of the level file name
+INPUT = struct.Struct('<bbBdd')         # moveX, moveY, flags, targetX, targetY
+HASH = struct.Struct('<I8s')            # epoch, state hash
+
+
+def stateHash(state: GameState) -> bytes:
+    """8 byte digest of everything the simulation changes from tick to tick."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(struct.pack('<qii', state.epoch, state.worldWidth, state.worldHeight))
+    for unit in state.units:
+        digest.update(struct.pack('<iiiiddq', unit.x, unit.y, unit.status, int(unit.orientation),
+                                  unit.targetX, unit.targetY, unit.lastBulletEpoch))
+    bullets = state.bullets
+    digest.update(bullets.position[:bullets.count].tobytes())
+    digest.update(bullets.alive[:bullets.count].tobytes())
+    return digest.digest()
+
+
+class Recorder:
+    """Writes the inputs of a session, call record() before and afterStep() after each step."""
+
+    def __init__(self, fileName: str, levelFile: str, hashInterval: int = 30):
+        self.hashInterval = hashInterval
+        self.file: BinaryIO = open(fileName, 'wb')
+        level = levelFile.encode()
+        self.file.write(HEADER.pack(MAGIC, VERSION, hashInterval, len(level)))
+        self.file.write(level)
+
+    def record(self, playerInput: PlayerInput):
+        self.file.write(playerInput.pack(INPUT))
+
+    def afterStep(self, simulation: Simulation):
+        epoch = simulation.state.epoch
+        if epoch % self.hashInterval == 0:
+            self.file.write(HASH.pack(epoch, stateHash(simulation.state)))
+
+    def close(self):
+        self.file.close()
+
+
+class Replay:
+    """Recorded session, loaded in full."""
+
+    def __init__(self, levelFile: str, hashInterval: int, inputs: list[PlayerInput], hashes: dict[int, bytes]):
+        self.levelFile = levelFile
+        self.hashInterval = hashInterval
+        self.inputs = inputs
+        self.hashes = hashes
+        self.desyncEpoch: Optional[int] = None
+
+    @classmethod
+    def load(cls, fileName: str) -> "Replay":
+        with open(fileName, 'rb') as file:
+            data = file.read()
+        if len(data) < HEADER.size:
+            raise RuntimeError("Error in {}: not a replay".format(fileName))
+        magic, version, hashInterval, levelSize = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise RuntimeError("Error in {}: not a replay".format(fileName))
+        if version != VERSION:
+            raise RuntimeError("Error in {}: unsupported replay version {}".format(fileName, version))
+        offset = HEADER.size
+        levelFile = data[offset:offset + levelSize].decode()
+        offset += levelSize
+
+        # a hash follows every hashInterval-th input; a session may end anywhere
+        inputs = []
+        hashes = {}
+        while offset + INPUT.size <= len(data):
+            inputs.append(PlayerInput.unpack(INPUT, data, offset))
+            offset += INPUT.size
+            if len(inputs) % hashInterval == 0 and offset + HASH.size <= len(data):
+                epoch, digest = HASH.unpack_from(data, offset)
+                offset += HASH.size
+                hashes[epoch] = digest
+        return cls(levelFile, hashInterval, inputs, hashes)
+
+    def controller(self) -> ScriptedController:
+        return ScriptedController(self.inputs)
+
+    def check(self, simulation: Simulation) -> bool:
+        """Compares the state with the recording if a hash exists for this epoch; remembers the first desync."""
+        expected = self.hashes.get(simulation.state.epoch)
+        if expected is None or expected == stateHash(simulation.state):
+            return True
+        if self.desyncEpoch is None:
+            self.desyncEpoch = simulation.state.epoch
+        return False
+
+    def run(self, simulation: Simulation = None, stopOnDesync: bool = True) -> Simulation:
+        """Replays the whole session headless, as fast as possible."""
+        if simulation is None:
+            simulation = Simulation()
+        simulation.loadLevel(self.levelFile)
+        for playerInput in self.inputs:
+            if not simulation.running:
+                break
+            simulation.step(playerInput)
+            if not self.check(simulation) and stopOnDesync:
+                break
+        return simulation
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('replay', help='replay file written by the game')
+    parser.add_argument('--keep-going', action='store_true', help='continue after the first desync')
+    args = parser.parse_args()
+
+    replay = Replay.load(args.replay)
+    start = time.perf_counter()
+    simulation = replay.run(stopOnDesync=not args.keep_going)
+    elapsed = time.perf_counter() - start
+
+    print('level {}, {} inputs, {} hashes, {} epochs in {:.3f} s'.format(
+        replay.levelFile, len(replay.inputs), len(replay.hashes), simulation.state.epoch, elapsed))
+    if replay.desyncEpoch is not None:
+        print('desync at epoch {}'.format(replay.desyncEpoch))
+        raise SystemExit(1)
+    print('winner: {}'.format(simulation.winner))
+
+
+if __name__ == '__main__':
+    main()
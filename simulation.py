@@ -0,0 +1,217 @@
+import random
+import struct
+from typing import Optional
+
+from pygame import Vector2
+
+from game_state import GameState
+from unit import Unit, ALIVE
+from command import Command, MoveCommand, TargetCommand, ShootCommand, \
+    DecodeLevelCommand
+from system import System, PursuitSystem, TargetingSystem, FiringSystem, \
+    BulletMotionSystem, CleanupSystem
+from visibility import hasLineOfSight
+from snapshot import saveSnapshot, loadSnapshot
+
+
+# PlayerInput.flags bits
+SHOOT = 1
+HAS_TARGET = 2
+
+
+class PlayerInput:
+    def __init__(self, moveVector: Vector2 = None, targetVector: Vector2 = None, shoot: bool = False):
+        self.moveVector = moveVector if moveVector is not None else Vector2(0, 0)
+        self.targetVector = targetVector    # None keeps the current weapon target
+        self.shoot = shoot
+
+    def merge(self, playerInput: "PlayerInput"):
+        """Folds a later input into this one: the last move and target win, any shot counts."""
+        if playerInput.moveVector.x != 0 or playerInput.moveVector.y != 0:
+            self.moveVector = playerInput.moveVector
+        if playerInput.targetVector is not None:
+            self.targetVector = playerInput.targetVector
+        self.shoot = self.shoot or playerInput.shoot
+
+    def pack(self, layout: struct.Struct, *prefix) -> bytes:
+        """Packs into layout, which ends with moveX, moveY, flags, targetX, targetY after the prefix fields."""
+        flags = SHOOT if self.shoot else 0
+        targetX = targetY = 0.0
+        if self.targetVector is not None:
+            flags |= HAS_TARGET
+            targetX, targetY = self.targetVector
+        return layout.pack(*prefix, int(self.moveVector.x), int(self.moveVector.y), flags, targetX, targetY)
+
+    @classmethod
+    def unpack(cls, layout: struct.Struct, data: bytes, offset: int = 0) -> "PlayerInput":
+        """Reverse of pack(); leading prefix fields of layout are skipped."""
+        *_, moveX, moveY, flags, targetX, targetY = layout.unpack_from(data, offset)
+        targetVector = Vector2(targetX, targetY) if flags & HAS_TARGET else None
+        return cls(Vector2(moveX, moveY), targetVector, bool(flags & SHOOT))
+
+
+class Controller:
+    def nextInput(self, simulation: "Simulation") -> PlayerInput:
+        raise NotImplementedError()
+
+
+class IdleController(Controller):
+    def nextInput(self, simulation: "Simulation") -> PlayerInput:
+        return PlayerInput()
+
+
+class ScriptedController(Controller):
+    """Plays a fixed list of inputs, one per tick, then stays idle."""
+
+    def __init__(self, inputs: list[PlayerInput]):
+        self.inputs = inputs
+        self.index = 0
+
+    def nextInput(self, simulation: "Simulation") -> PlayerInput:
+        if self.index >= len(self.inputs):
+            return PlayerInput()
+        playerInput = self.inputs[self.index]
+        self.index += 1
+        return playerInput
+
+
+class AIController(Controller):
+    """Aims at the nearest enemy, shoots when it is in range and wanders randomly."""
+
+    def __init__(self, seed: int = 0, moveChance: float = 0.2):
+        self.random = random.Random(seed)
+        self.moveChance = moveChance
+
+    def nextInput(self, simulation: "Simulation") -> PlayerInput:
+        state = simulation.state
+        player = simulation.playerUnit
+
+        target: Optional[Unit] = None
+        bestDistance = None
+        for unit in state.units:
+            if unit is player or unit.status != ALIVE:
+                continue
+            distance = (unit.x - player.x) ** 2 + (unit.y - player.y) ** 2
+            if bestDistance is None or distance < bestDistance:
+                target = unit
+                bestDistance = distance
+
+        moveVector = Vector2(0, 0)
+        if self.random.random() < self.moveChance:
+            moveVector = self.random.choice([Vector2(1, 0), Vector2(-1, 0), Vector2(0, 1), Vector2(0, -1)])
+
+        if target is None:
+            return PlayerInput(moveVector)
+
+        inRange = bestDistance <= state.bulletRange ** 2 and hasLineOfSight(state, player.x, player.y, target.x, target.y)
+        return PlayerInput(moveVector, Vector2(target.position), inRange)
+
+
+class Simulation:
+    """Game logic on top of GameState, without window, event loop or frame cap."""
+
+    def __init__(self, state: GameState = None):
+        self.state = state if state is not None else GameState()
+        # players[0] is the local player, networked matches add more
+        self.players: list[Unit] = [self.state.units[0]]
+        self.playerPositions: list[Vector2] = [self.players[0].position]
+        self.running = True
+        self.lastCommands: list[Command] = []
+
+        # run in this order every tick, after the player commands
+        self.systems: list[System] = [
+            PursuitSystem(),
+            TargetingSystem(),
+            FiringSystem(),
+            BulletMotionSystem(),
+            CleanupSystem(),
+        ]
+
+    @property
+    def playerUnit(self) -> Unit:
+        return self.players[0]
+
+    @playerUnit.setter
+    def playerUnit(self, unit: Unit):
+        self.players = [unit]
+        self.playerPositions = [unit.position]
+
+    @property
+    def playerPosition(self) -> Vector2:
+        return self.playerPositions[0]
+
+    def addPlayer(self, unit: Unit):
+        self.players.append(unit)
+        self.playerPositions.append(unit.position)
+
+    def livePlayerCells(self) -> list[tuple[int, int]]:
+        """Cells of the players still alive, as they were at the start of the tick."""
+        return [(int(position.x), int(position.y))
+                for player, position in zip(self.players, self.playerPositions) if player.status == ALIVE]
+
+    def loadLevel(self, fileName: str) -> DecodeLevelCommand:
+        level = DecodeLevelCommand(self.state, fileName)
+        level.run()
+        self.playerUnit = level.playerUnit
+        self.running = True
+        return level
+
+    def snapshot(self) -> bytes:
+        return saveSnapshot(self.state, self.playerUnit)
+
+    def restore(self, data: bytes, zeroCopy: bool = True):
+        self.playerUnit = loadSnapshot(self.state, data, zeroCopy)
+        self.running = self.winner is None
+
+    @property
+    def winner(self) -> Optional[str]:
+        alivePlayers = sum(1 for player in self.players if player.status == ALIVE)
+        if alivePlayers == 0:
+            return 'enemies'
+        if len(self.state.units) <= alivePlayers:
+            return 'player'
+        return None
+
+    def playerCommands(self, playerInput: PlayerInput, unit: Unit = None) -> list[Command]:
+        state = self.state
+        unit = unit if unit is not None else self.playerUnit
+        commands: list[Command] = []
+        if playerInput.targetVector is not None:
+            commands.append(TargetCommand(state, unit, playerInput.targetVector))
+        if playerInput.moveVector.x != 0 or playerInput.moveVector.y != 0:
+            commands.append(MoveCommand(state, unit, playerInput.moveVector))
+        if playerInput.shoot:
+            commands.append(ShootCommand(state, unit))
+        return commands
+
+    def step(self, playerInput: PlayerInput = None):
+        self.stepPlayers([playerInput])
+
+    def stepPlayers(self, playerInputs: list[Optional[PlayerInput]]):
+        """One tick with an input per entry of players; None means no input."""
+        # AI reacts to where the players were at the start of the tick
+        self.playerPositions = [player.position for player in self.players]
+        for system in self.systems:
+            system.beginTick(self)
+        self.lastCommands = []
+        for player, playerInput in zip(self.players, playerInputs):
+            if playerInput is not None and player.status == ALIVE:
+                self.lastCommands.extend(self.playerCommands(playerInput, player))
+        for cmd in self.lastCommands:
+            cmd.run()
+        for system in self.systems:
+            system.update(self)
+        self.state.epoch += 1
+        # events of the whole tick go out together, after the update phase
+        self.state.events.dispatch()
+
+        if self.winner is not None:
+            self.running = False
+
+    def run(self, controller: Controller, ticks: int) -> int:
+        """Steps up to ticks epochs as fast as possible, returns the number of steps done."""
+        steps = 0
+        while steps < ticks and self.running:
+            self.step(controller.nextInput(self))
+            steps += 1
+        return steps
@@ -0,0 +1,127 @@
+import struct
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+from pygame import Vector2
+
+import level_cache
+from unit import Tank, Tower, Unit
+
+if TYPE_CHECKING:
+    from game_state import GameState
+
+
+MAGIC = b'TKSN'
+VERSION = 2
+
+# magic, version, width, height, epoch, ground and walls columns, units, bullets, player index,
+# bulletSpeed, bulletRange, bulletDelay
+HEADER = struct.Struct('<4sHiiqiiiiiddi')
+
+UNIT_DTYPE = np.dtype([
+    ('kind', 'u1'), ('status', 'i1'), ('tileX', 'i2'), ('tileY', 'i2'),
+    ('x', '<i4'), ('y', '<i4'), ('orientation', '<f8'),
+    ('targetX', '<f8'), ('targetY', '<f8'), ('lastBulletEpoch', '<i8'),
+])
+BULLET_DTYPE = np.dtype([
+    ('position', '<f8', 2), ('direction', '<f8', 2), ('start', '<f8', 2),
+    ('owner', '<i4'), ('alive', '?'), ('id', '<i8'),
+])
+
+
+def saveSnapshot(state: "GameState", playerUnit: Unit = None) -> bytes:
+    """Serializes the whole game state; playerUnit is remembered by its index in state.units."""
+    units = np.zeros(len(state.units), dtype=UNIT_DTYPE)
+    index = {}
+    for i, unit in enumerate(state.units):
+        index[id(unit)] = i
+        units[i] = (level_cache.TANK if isinstance(unit, Tank) else level_cache.TOWER, unit.status,
+                    int(unit.tile.x), int(unit.tile.y), unit.x, unit.y, unit.orientation,
+                    unit.targetX, unit.targetY, unit.lastBulletEpoch)
+
+    store = state.bullets
+    n = store.count
+    bullets = np.zeros(n, dtype=BULLET_DTYPE)
+    bullets['position'] = store.position[:n]
+    bullets['direction'] = store.direction[:n]
+    bullets['start'] = store.start[:n]
+    bullets['alive'] = store.alive[:n]
+    bullets['id'] = store.ids[:n]
+    bullets['owner'] = [index.get(id(owner), -1) for owner in store.owner[:n]]
+
+    header = HEADER.pack(MAGIC, VERSION, state.worldWidth, state.worldHeight, state.epoch,
+                         state.ground.columns, state.walls.columns, len(units), n,
+                         index.get(id(playerUnit), -1), state.bulletSpeed, state.bulletRange, state.bulletDelay)
+    return b''.join([header, state.ground.toArray().tobytes(), state.walls.toArray().tobytes(),
+                     units.tobytes(), bullets.tobytes()])
+
+
+def loadSnapshot(state: "GameState", data: bytes, zeroCopy: bool = True) -> Optional[Unit]:
+    """Restores a snapshot into state and returns the saved playerUnit.
+
+    With zeroCopy the tile grids read their chunks straight from data, which
+    must then stay unchanged while the state is in use.
+    """
+    if len(data) < HEADER.size:
+        raise RuntimeError("Error in snapshot: too short")
+    magic, version, width, height, epoch, groundColumns, wallsColumns, unitCount, bulletCount, \
+        playerIndex, bulletSpeed, bulletRange, bulletDelay = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise RuntimeError("Error in snapshot: invalid magic")
+    if version != VERSION:
+        raise RuntimeError("Error in snapshot: unsupported version {}".format(version))
+    expected = HEADER.size + 2 * width * height * 4 + unitCount * UNIT_DTYPE.itemsize + bulletCount * BULLET_DTYPE.itemsize
+    if len(data) != expected:
+        raise RuntimeError("Error in snapshot: size {} instead of {}".format(len(data), expected))
+
+    offset = HEADER.size
+    ground = np.frombuffer(data, dtype='<i4', count=width * height, offset=offset).reshape(height, width)
+    offset += ground.nbytes
+    walls = np.frombuffer(data, dtype='<i4', count=width * height, offset=offset).reshape(height, width)
+    offset += walls.nbytes
+    units = np.frombuffer(data, dtype=UNIT_DTYPE, count=unitCount, offset=offset)
+    offset += units.nbytes
+    bullets = np.frombuffer(data, dtype=BULLET_DTYPE, count=bulletCount, offset=offset)
+
+    if not zeroCopy:
+        ground, walls = ground.copy(), walls.copy()
+    state.worldSize = Vector2(width, height)
+    state.ground.reset(width, height, groundColumns, ground)
+    state.walls.reset(width, height, wallsColumns, walls)
+
+    tiles: dict[tuple[int, int], Vector2] = {}      # units of the same kind share their tile
+    restored = []
+    for kind, status, tileX, tileY, x, y, orientation, targetX, targetY, lastBulletEpoch in units.tolist():
+        if (tileX, tileY) not in tiles:
+            tiles[tileX, tileY] = Vector2(tileX, tileY)
+        clsUnit = Tank if kind == level_cache.TANK else Tower
+        unit = clsUnit(state, Vector2(x, y), tiles[tileX, tileY])
+        unit.status = status
+        unit.orientation = int(orientation) if orientation.is_integer() else orientation
+        unit.targetX = targetX
+        unit.targetY = targetY
+        unit.lastBulletEpoch = lastBulletEpoch
+        restored.append(unit)
+    state.units[:] = restored
+    state.rebuildUnitGrid()
+
+    store = state.bullets
+    store.clear()
+    while store.capacity < bulletCount:
+        store.grow()
+    store.position[:bulletCount] = bullets['position']
+    store.direction[:bulletCount] = bullets['direction']
+    store.start[:bulletCount] = bullets['start']
+    store.alive[:bulletCount] = bullets['alive']
+    store.ids[:bulletCount] = bullets['id']
+    if bulletCount > 0:
+        store.nextId = max(store.nextId, int(bullets['id'].max()) + 1)
+    store.owner[:bulletCount] = [restored[owner] if owner >= 0 else None for owner in bullets['owner'].tolist()]
+    store.count = bulletCount
+
+    state.bulletSpeed = int(bulletSpeed) if bulletSpeed.is_integer() else bulletSpeed
+    state.bulletRange = int(bulletRange) if bulletRange.is_integer() else bulletRange
+    state.bulletDelay = bulletDelay
+    state.epoch = epoch
+    state.events.clear()
+    return restored[playerIndex] if playerIndex >= 0 else None
@@ -0,0 +1,111 @@
+from typing import TYPE_CHECKING
+
+from unit import Tank, ALIVE
+from flow_field import FlowField
+from visibility import VisibilityField
+
+if TYPE_CHECKING:
+    from simulation import Simulation
+
+
+class System:
+    """Persistent per-tick update step; iterates its entities directly every tick."""
+
+    def beginTick(self, simulation: "Simulation"):
+        pass
+
+    def update(self, simulation: "Simulation"):
+        raise NotImplementedError()
+
+
+class PursuitSystem(System):
+    """Tanks other than the players drive towards the nearest player along a shared flow field."""
+
+    def __init__(self, moveDelay: int = 10, radius: int = 32):
+        self.moveDelay = moveDelay
+        self.field = FlowField(radius)
+
+    def update(self, simulation: "Simulation"):
+        state = simulation.state
+        if state.epoch % self.moveDelay != 0:
+            return
+        players = set(simulation.players)
+        pursuers = [unit for unit in state.units if type(unit) is Tank and unit not in players and unit.status == ALIVE]
+        targets = simulation.livePlayerCells()
+        if len(pursuers) == 0 or len(targets) == 0:
+            return
+
+        field = self.field
+        field.update(state, targets)
+        for unit in pursuers:
+            # plain cell moves, commands are kept for player actions
+            step = field.nextStep(unit.x, unit.y)
+            if step is not None:
+                state.tryMove(unit, int(step.x), int(step.y))
+
+
+class TargetingSystem(System):
+    def update(self, simulation: "Simulation"):
+        # all units except the players aim at the nearest player
+        players = set(simulation.players)
+        targets = simulation.livePlayerCells()
+        if len(targets) == 0:
+            return
+        for unit in simulation.state.units:
+            if unit in players:
+                continue
+            targetX, targetY = targets[0]
+            if len(targets) > 1:
+                targetX, targetY = min(targets, key=lambda cell: (cell[0] - unit.x) ** 2 + (cell[1] - unit.y) ** 2)
+            unit.targetX = float(targetX)
+            unit.targetY = float(targetY)
+
+
+class FiringSystem(System):
+    def __init__(self):
+        self.fields: dict[tuple[int, int], VisibilityField] = {}
+
+    def update(self, simulation: "Simulation"):
+        # units which have their target player in range of attack and see it shoot
+        state = simulation.state
+        players = set(simulation.players)
+        fields = {}
+        for cell in simulation.livePlayerCells():
+            field = self.fields.get(cell) or VisibilityField(state.bulletRange)
+            field.radius = state.bulletRange
+            field.update(state, *cell)
+            fields[cell] = field
+        # fields of cells no player stands on anymore are dropped
+        self.fields = fields
+
+        for unit in state.units:
+            if unit in players:
+                continue
+            field = fields.get((int(unit.targetX), int(unit.targetY)))
+            if field is not None and field.canSee(unit.x, unit.y):
+                state.shoot(unit)
+
+
+class BulletMotionSystem(System):
+    def __init__(self):
+        self.count = 0
+
+    def beginTick(self, simulation: "Simulation"):
+        # bullets fired during this tick start moving on the next one
+        self.count = len(simulation.state.bullets)
+
+    def update(self, simulation: "Simulation"):
+        simulation.state.bullets.step(simulation.state, self.count)
+
+
+class CleanupSystem(System):
+    def update(self, simulation: "Simulation"):
+        state = simulation.state
+        state.bullets.deleteDestroyed()
+
+        if all(unit.status == ALIVE for unit in state.units):
+            return
+        for unit in state.units:
+            if unit.status != ALIVE:
+                state.removeUnit(unit)
+        state.units[:] = [unit for unit in state.units if unit.status == ALIVE]
@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from pygame import Vector2
+
+
+# tile id of an empty cell
+EMPTY = -1
+
+
+class ChunkedTileGrid:
+    """Tile ids of one map layer, stored in square chunks.
+
+    Chunks are copied on demand from source (usually the memory-mapped array
+    of a compiled level) and the least recently used ones are evicted. Chunks
+    changed through set() are kept until the next reset(). Tile ids are local
+    to the layer's tileset, -1 marks an empty cell.
+    """
+
+    def __init__(self, width: int = 0, height: int = 0, columns: int = 1, source: np.ndarray = None,
+                 chunkSize: int = 32, maxChunks: int = 1024):
+        self.chunkSize = chunkSize
+        self.maxChunks = maxChunks
+        self.revision = 0
+        self.reset(width, height, columns, source)
+
+    def reset(self, width: int, height: int, columns: int, source: np.ndarray = None):
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.source = source
+        self.chunks: OrderedDict[tuple[int, int], np.ndarray] = OrderedDict()
+        self.modified: dict[tuple[int, int], np.ndarray] = {}
+        self.tiles: dict[int, Vector2] = {}
+        self.revision += 1
+
+    @classmethod
+    def fromRows(cls, rows: list[list[Optional[Vector2]]], columns: int, **kwargs) -> "ChunkedTileGrid":
+        array = np.array([[EMPTY if tile is None else int(tile.y) * columns + int(tile.x) for tile in row]
+                          for row in rows], dtype=np.int32)
+        height, width = array.shape
+        return cls(width, height, columns, array, **kwargs)
+
+
+    def chunk(self, chunkX: int, chunkY: int) -> np.ndarray:
+        key = (chunkX, chunkY)
+        chunk = self.modified.get(key)
+        if chunk is not None:
+            return chunk
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            self.chunks.move_to_end(key)
+            return chunk
+
+        size = self.chunkSize
+        x0, y0 = chunkX * size, chunkY * size
+        x1, y1 = min(x0 + size, self.width), min(y0 + size, self.height)
+        if self.source is None:
+            chunk = np.full((y1 - y0, x1 - x0), EMPTY, dtype=np.int32)
+        else:
+            chunk = np.array(self.source[y0:y1, x0:x1], dtype=np.int32)
+        self.chunks[key] = chunk
+        if len(self.chunks) > self.maxChunks:
+            self.chunks.popitem(last=False)
+        return chunk
+
+    def get(self, x: int, y: int) -> int:
+        size = self.chunkSize
+        return int(self.chunk(x // size, y // size)[y % size, x % size])
+
+    def getMany(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Tile ids of the cells (xs[i], ys[i]), gathered from the source in one go."""
+        if self.source is None:
+            result = np.full(len(xs), EMPTY, dtype=np.int32)
+        else:
+            result = np.asarray(self.source[ys, xs], dtype=np.int32)
+        if len(self.modified) == 0 or len(xs) == 0:
+            return result
+        size = self.chunkSize
+        chunkX, chunkY = xs // size, ys // size
+        for (modifiedX, modifiedY), chunk in self.modified.items():
+            mask = (chunkX == modifiedX) & (chunkY == modifiedY)
+            if mask.any():
+                result[mask] = chunk[ys[mask] % size, xs[mask] % size]
+        return result
+
+    def isEmpty(self, x: int, y: int) -> bool:
+        return self.get(x, y) == EMPTY
+
+    def set(self, x: int, y: int, tileId: int):
+        size = self.chunkSize
+        key = (x // size, y // size)
+        chunk = self.chunk(*key)
+        chunk[y % size, x % size] = tileId
+        # modified chunks are never evicted, the source does not have the change
+        self.modified[key] = chunk
+        self.chunks.pop(key, None)
+        self.revision += 1
+
+
+    def tileId(self, tile: Optional[Vector2]) -> int:
+        if tile is None:
+            return EMPTY
+        return int(tile.y) * self.columns + int(tile.x)
+
+    def tile(self, tileId: int) -> Optional[Vector2]:
+        """Tileset coordinates of tileId, shared between all cells using it."""
+        if tileId == EMPTY:
+            return None
+        tile = self.tiles.get(tileId)
+        if tile is None:
+            tile = Vector2(tileId % self.columns, tileId // self.columns)
+            self.tiles[tileId] = tile
+        return tile
+
+    def tileAt(self, x: int, y: int) -> Optional[Vector2]:
+        return self.tile(self.get(x, y))
+
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Tile ids of cells x0 <= x < x1, y0 <= y < y1, assembled from the chunks."""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        result = np.full((max(0, y1 - y0), max(0, x1 - x0)), EMPTY, dtype=np.int32)
+        size = self.chunkSize
+        for chunkY in range(y0 // size, (y1 - 1) // size + 1 if y1 > y0 else 0):
+            for chunkX in range(x0 // size, (x1 - 1) // size + 1 if x1 > x0 else 0):
+                chunk = self.chunk(chunkX, chunkY)
+                cx0, cy0 = chunkX * size, chunkY * size
+                sx0, sy0 = max(x0, cx0), max(y0, cy0)
+                sx1, sy1 = min(x1, cx0 + chunk.shape[1]), min(y1, cy0 + chunk.shape[0])
+                result[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = chunk[sy0 - cy0:sy1 - cy0, sx0 - cx0:sx1 - cx0]
+        return result
+
+    def toArray(self) -> np.ndarray:
+        if self.source is not None and not self.modified:
+            return np.array(self.source, dtype=np.int32)
+        return self.region(0, 0, self.width, self.height)
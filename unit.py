@@ -7,38 +7,58 @@ if TYPE_CHECKING:
     from game_state import GameState
 
 
+# status codes
+ALIVE = 0
+DESTROYED = 1
+
+
 class GameItem:
+    # grid-aligned items keep integer cell coordinates; position and
+    # weaponTarget are Vector2 views built on access
+    __slots__ = ('state', 'x', 'y', 'tile', 'orientation', 'status', 'targetX', 'targetY')
+
     def __init__(self, state: "GameState", position: Vector2, tile: Vector2):
         self.state = state
-        self.position = position
+        self.x = int(position.x)
+        self.y = int(position.y)
         self.tile = tile
         self.orientation = 0                # angle
-        self.status = 'alive'  
+        self.status = ALIVE
+
+        self.targetX = 0.0                  # default
+        self.targetY = 1.0
+
+    @property
+    def position(self) -> Vector2:
+        return Vector2(self.x, self.y)
+
+    @position.setter
+    def position(self, position: Vector2):
+        self.x = int(position.x)
+        self.y = int(position.y)
 
-        self.weaponTarget = Vector2(0, 1)   # default
+    @property
+    def weaponTarget(self) -> Vector2:
+        return Vector2(self.targetX, self.targetY)
+
+    @weaponTarget.setter
+    def weaponTarget(self, target: Vector2):
+        self.targetX = float(target.x)
+        self.targetY = float(target.y)
 
 
 class Unit(GameItem):
+    __slots__ = ('lastBulletEpoch',)
+
     def __init__(self, state: "GameState", position: Vector2, tile: Vector2):
         super().__init__(state, position, tile)
-        
-        self.weaponTarget = Vector2(0, 1)   
-        self.lastBulletEpoch = -100
 
-
-class Bullet(GameItem):
-    def __init__(self, state: "GameState", unit: "Unit"):
-        super().__init__(state, unit.position, Vector2(6, 1))
-
-        self.unit = unit
-        self.startPosition = unit.position
-        self.endPosition = unit.weaponTarget
-        self.direction = (self.endPosition - self.startPosition).normalize()
+        self.lastBulletEpoch = -100
 
 
 class Tank(Unit):
-    pass
+    __slots__ = ()
 
 
 class Tower(Unit):
-    pass
\ No newline at end of file
+    __slots__ = ()
@@ -0,0 +1,111 @@
+from typing import Optional, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from unit import Unit
+
+
+class UnitGrid:
+    """Occupancy index of the map: the unit standing on each cell, if any.
+
+    Like ChunkedTileGrid it is stored in square chunks, but a chunk only
+    exists while a unit stands on it, so memory follows the number of units
+    and not the map size. A small table maps each chunk of the map to its
+    slot in a pool of chunk arrays (-1 for a chunk without units), which
+    keeps batched lookups vectorized; single cells are looked up in a dict.
+    """
+
+    def __init__(self, width: int = 0, height: int = 0, chunkSize: int = 8, capacity: int = 64):
+        self.chunkSize = chunkSize
+        self.initialCapacity = capacity
+        self.reset(width, height)
+
+    def reset(self, width: int, height: int):
+        size = self.chunkSize
+        self.width = width
+        self.height = height
+        self.table = np.full(((height + size - 1) // size, (width + size - 1) // size), -1, dtype=np.int32)
+        self.pool = np.full((self.initialCapacity, size, size), None, dtype=object)
+        self.counts = np.zeros(self.initialCapacity, dtype=np.int32)
+        self.freeSlots = list(range(self.initialCapacity - 1, -1, -1))
+        self.cells: dict[tuple[int, int], "Unit"] = {}
+
+    @property
+    def chunkCount(self) -> int:
+        return len(self.pool) - len(self.freeSlots)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def get(self, x: int, y: int) -> Optional["Unit"]:
+        return self.cells.get((x, y))
+
+    def set(self, x: int, y: int, unit: "Unit"):
+        size = self.chunkSize
+        chunkX, chunkY = x // size, y // size
+        slot = int(self.table[chunkY, chunkX])
+        if slot < 0:
+            slot = self.allocate()
+            self.table[chunkY, chunkX] = slot
+        if self.pool[slot, y % size, x % size] is None:
+            self.counts[slot] += 1
+        self.pool[slot, y % size, x % size] = unit
+        self.cells[x, y] = unit
+
+    def remove(self, x: int, y: int, unit: "Unit" = None):
+        """Frees the cell; if unit is given, only when that unit stands there."""
+        current = self.cells.get((x, y))
+        if current is None or (unit is not None and current is not unit):
+            return
+        del self.cells[x, y]
+        size = self.chunkSize
+        chunkX, chunkY = x // size, y // size
+        slot = int(self.table[chunkY, chunkX])
+        self.pool[slot, y % size, x % size] = None
+        self.counts[slot] -= 1
+        if self.counts[slot] == 0:
+            self.table[chunkY, chunkX] = -1
+            self.freeSlots.append(slot)
+
+    def allocate(self) -> int:
+        if len(self.freeSlots) == 0:
+            capacity = len(self.pool)
+            pool = np.full((capacity * 2,) + self.pool.shape[1:], None, dtype=object)
+            pool[:capacity] = self.pool
+            self.pool = pool
+            self.counts = np.concatenate([self.counts, np.zeros(capacity, dtype=np.int32)])
+            self.freeSlots = list(range(capacity * 2 - 1, capacity - 1, -1))
+        return self.freeSlots.pop()
+
+    def getMany(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Units on the cells (xs[i], ys[i]) as an object array, None for free cells."""
+        result = np.full(len(xs), None, dtype=object)
+        if len(xs) == 0:
+            return result
+        size = self.chunkSize
+        slots = self.table[ys // size, xs // size]
+        occupied = slots >= 0
+        result[occupied] = self.pool[slots[occupied], ys[occupied] % size, xs[occupied] % size]
+        return result
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Units on cells x0 <= x < x1, y0 <= y < y1 as an object array, assembled from the chunks."""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        result = np.full((max(0, y1 - y0), max(0, x1 - x0)), None, dtype=object)
+        size = self.chunkSize
+        for chunkY in range(y0 // size, (y1 - 1) // size + 1 if y1 > y0 else 0):
+            for chunkX in range(x0 // size, (x1 - 1) // size + 1 if x1 > x0 else 0):
+                slot = self.table[chunkY, chunkX]
+                if slot < 0:
+                    continue
+                cx0, cy0 = chunkX * size, chunkY * size
+                sx0, sy0 = max(x0, cx0), max(y0, cy0)
+                sx1, sy1 = min(x1, cx0 + size), min(y1, cy0 + size)
+                result[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = self.pool[slot, sy0 - cy0:sy1 - cy0, sx0 - cx0:sx1 - cx0]
+        return result
+
+    def memoryUsage(self) -> int:
+        """Bytes held by the chunk table and the pool of chunk arrays."""
+        return self.table.nbytes + self.pool.nbytes + self.counts.nbytes
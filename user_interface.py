@@ -1,35 +1,63 @@
 import os
+import time
 from os.path import join
+from typing import Optional
 
 import pygame
 from pygame import Vector2
 
-from game_state import GameState
 from layer import Layer, ArrayLayer, UnitsLayer, \
-    BulletLayer, ExplosionsLayer
-from unit import Unit, Bullet
-from command import MoveCommand, TargetCommand, \
-    Command, MoveBulletCommand, ShootCommand,  \
-        DeleteDestroyedCommand, LoadLevelCommand
+    BulletLayer, ExplosionsLayer, RotationCache
+from unit import Unit
+from command import Command, LoadLevelCommand
+from simulation import Simulation, PlayerInput
+from profiler import FrameProfiler
+from camera import Camera
+from replay import Recorder, Replay
+from interpolation import TickHistory
+from level_loader import PreparedLevel
 
 
 os.environ['SDL_VIDEO_CENTERED'] = '1'
-FPS = 30
+TICK_RATE = 30
+MAX_CATCH_UP = 5
+WINDOW_SIZE = (16 * 64, 10 * 64)
 
 
 class UserInterface:
 
-    def __init__(self):
+    def __init__(self, dirtyRects: bool = False, profile: bool = False, profileDump: str = None,
+                 windowSize: tuple[int, int] = WINDOW_SIZE, record: str = None, replay: str = None,
+                 tickRate: int = TICK_RATE, maxFps: int = 0, maxCatchUp: int = MAX_CATCH_UP,
+                 levelFile: str = None, level: PreparedLevel = None):
         pygame.init()
         pygame.display.set_caption('Python test game')
         pygame.display.set_icon(pygame.image.load(join('images', 'icon2.png')))
 
-        self.gameState = GameState()
+        # all game logic lives in the simulation, the UI only feeds it input
+        self.simulation = Simulation()
+        self.gameState = self.simulation.state
+        self.playerInput = PlayerInput()
         self.cellSize = Vector2(64, 64)
 
-        # (x1, y1) * (x2, y2) --> (x1*x2, y1*y2)
-        worldSize = self.gameState.worldSize.elementwise() * self.cellSize
-        self.window = pygame.display.set_mode((int(worldSize.x), int(worldSize.y)))
+        # the simulation ticks at a fixed rate, frames are drawn between the last two ticks
+        self.tickRate = tickRate
+        self.maxFps = maxFps
+        self.maxCatchUp = maxCatchUp
+        self.history = TickHistory()
+        self.alpha = 1.0
+
+        # the window keeps its size, the camera follows the player on bigger maps
+        self.window = pygame.display.set_mode(windowSize)
+        self.camera = Camera(windowSize, self.cellSize)
+        self.camera.setWorld(self.gameState.worldSize, self.cellSize)
+
+        # decoded by the menu's loader, so the layers below find their textures in memory
+        if level is not None and replay is None:
+            level.install()
+
+        # rotated sprites (hulls and turrets) are shared by all layers
+        self.rotationCache = RotationCache()
 
         self.layers: list[Layer] = [
             ArrayLayer(self, join('images', 'background', 'ground.png'), self.gameState, self.gameState.ground),
@@ -39,18 +67,57 @@ class UserInterface:
             ExplosionsLayer(self, join('images', 'explosions', 'explosions.png'))
         ]
 
+        # opt-in: restore and flush only the regions dynamic layers touched
+        self.dirtyRects = dirtyRects
+        self.background: Optional[pygame.Surface] = None
+        self.backgroundRevisions = None
+        self.backgroundOffset = Vector2(0, 0)
+        for layer in self.layers:
+            layer.trackRects = dirtyRects and not layer.static
+
+        # optional instrumentation, F3 toggles the overlay
+        self.profiler: Optional[FrameProfiler] = FrameProfiler() if profile or profileDump else None
+        self.profileDump = profileDump
+        self.showOverlay = profile
+        self.overlayRect: Optional[pygame.Rect] = None
+
+        # optional input recording, or playback of a recording in real time
+        self.replay: Optional[Replay] = Replay.load(replay) if replay is not None else None
+        self.replayController = self.replay.controller() if self.replay is not None else None
+        if self.replay is not None:
+            self.levelFile = self.replay.levelFile
+            level = None
+        elif level is not None:
+            self.levelFile = level.fileName
+        else:
+            self.levelFile = levelFile if levelFile is not None else join('maps', 'level3.tmx')
+        self.recorder: Optional[Recorder] = Recorder(record, self.levelFile) if record is not None else None
+
+        # F5 saves, F9 restores; a rewind would not match the recorded inputs, so not while recording or replaying
+        self.quickSave: Optional[bytes] = None
+        self.quickSaveEnabled = self.recorder is None and self.replay is None
+
         self.commands: list[Command] = []
 
-        self.commands.append(LoadLevelCommand(self, join('maps', 'level3.tmx')))
+        self.commands.append(LoadLevelCommand(self, self.levelFile, level))
 
         # other staffs
         self.running = True
         self.clock = pygame.time.Clock()
-        self.playerUnit = self.gameState.units[0]   # hack
         
-        # add gameStateObserver's 
+        # layers handle only the events they draw
         for layer in self.layers:
-            self.gameState.registerObserver(layer)
+            layer.subscribe(self.gameState.events)
+
+
+    @property
+    def playerUnit(self) -> Unit:
+        return self.simulation.playerUnit
+    
+
+    @playerUnit.setter
+    def playerUnit(self, unit: Unit):
+        self.simulation.playerUnit = unit
 
 
     @property
@@ -73,6 +140,13 @@ class UserInterface:
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     self.running = False
+                elif event.key == pygame.K_F3 and self.profiler is not None:
+                    self.showOverlay = not self.showOverlay
+                elif event.key == pygame.K_F5 and self.quickSaveEnabled:
+                    self.quickSave = self.simulation.snapshot()
+                elif event.key == pygame.K_F9 and self.quickSave is not None:
+                    self.simulation.restore(self.quickSave)
+                    self.history.clear()
                 elif event.key == pygame.K_RIGHT:
                     moveVector = Vector2(1, 0)
                 elif event.key == pygame.K_LEFT:
@@ -85,70 +159,224 @@ class UserInterface:
                 mouseClicked = True
 
         
-        if not self.running:
+        if not self.running or self.replayController is not None:
             return
-        
-        # add TargetCommand for main unit
-        mousePos = Vector2(pygame.mouse.get_pos())
-        targetVector = Vector2(mousePos.x / self.cellWidth, mousePos.y / self.cellHeight) - Vector2(0.5, 0.5)      
-        cmd = TargetCommand(self.gameState, self.playerUnit, targetVector)
-        self.commands.append(cmd)
-
-        
-        # if tank is moving then add MoveCommand
-        if moveVector.x != 0 or moveVector.y != 0:
-            cmd = MoveCommand(self.gameState, self.playerUnit, moveVector)
-            self.commands.append(cmd)
-
-
-        if mouseClicked:
-            self.commands.append(ShootCommand(self.gameState, self.playerUnit))
-
-
-        # for all unit except playerUnit add TargetCommand (direction is player)
-        # if playerUnit is in range of attack then add ShootCommand
-        for unit in self.gameState.units:
-            if unit != self.playerUnit:
-                cmd = TargetCommand(self.gameState, unit, self.playerUnit.position)
-                self.commands.append(cmd)
-                if unit.position.distance_to(self.playerUnit.position) <= self.gameState.bulletRange:
-                    self.commands.append(
-                        ShootCommand(self.gameState, unit)
-                    )
-
-        for bullet in self.gameState.bullets:
-            self.commands.append(MoveBulletCommand(self.gameState, bullet))
-
-        
-        self.commands.append(DeleteDestroyedCommand(self.gameState.bullets))
-        self.commands.append(DeleteDestroyedCommand(self.gameState.units))
 
-        if self.playerUnit.status != 'alive' or len(self.gameState.units) <= 1:
-            self.running = False
+        # frames may outrun ticks: collect the input until the next tick takes it
+        mousePos = Vector2(pygame.mouse.get_pos())
+        targetVector = self.camera.screenToWorld(mousePos) - Vector2(0.5, 0.5)      
+        self.playerInput.merge(PlayerInput(moveVector, targetVector, mouseClicked))
+
+
+    def nextInput(self) -> Optional[PlayerInput]:
+        if self.replayController is not None:
+            if self.replayController.index >= len(self.replay.inputs):
+                return None
+            return self.replayController.nextInput(self.simulation)
+        playerInput = self.playerInput
+        self.playerInput = PlayerInput()
+        return playerInput
         
         
 
     def update(self):
+        if self.profiler is not None:
+            self.profiler.countCommands(self.commands)
         for cmd in self.commands:
             cmd.run()
         self.commands.clear()
+        self.gameState.events.dispatch()
+
+        if not self.running:
+            return
+        playerInput = self.nextInput()
+        if playerInput is None:
+            self.running = False
+            return
+        for layer in self.layers:
+            layer.tick()
+        self.history.capture(self.gameState)
+        if self.recorder is not None:
+            self.recorder.record(playerInput)
+        self.simulation.step(playerInput)
+        if self.recorder is not None:
+            self.recorder.afterStep(self.simulation)
+        if self.replay is not None:
+            self.replay.check(self.simulation)
+        if self.profiler is not None:
+            self.profiler.countCommands(self.simulation.lastCommands)
+        if not self.simulation.running:
+            self.running = False
 
 
     def render(self):
+        self.camera.follow(self.history.unitPosition(self.playerUnit, self.alpha)[0])
+        if self.dirtyRects:
+            self.renderDirty()
+            return
         self.window.fill('black')
-        for layer in self.layers:
-            layer.render(self.window)
+        for index, layer in enumerate(self.layers):
+            self.renderLayer(index, layer, self.window)
+        self.renderOverlay()
         pygame.display.update()
 
 
-    def run(self):
-        while self.running:
+    def renderLayer(self, index: int, layer: Layer, surface: pygame.Surface):
+        if self.profiler is None:
+            layer.render(surface)
+            return
+        with self.profiler.layer('{}.{}'.format(index, type(layer).__name__)):
+            layer.render(surface)
+
+
+    def renderOverlay(self) -> Optional[pygame.Rect]:
+        self.overlayRect = None
+        if self.profiler is not None and self.showOverlay:
+            self.overlayRect = self.profiler.drawOverlay(self.window)
+        return self.overlayRect
+
+
+    def renderBackground(self) -> bool:
+        """Brings the background up to date; True if it was drawn from scratch."""
+        staticLayers = [layer for layer in self.layers if layer.static]
+        revisions = tuple(layer.revision for layer in staticLayers)
+        width, height = self.window.get_size()
+        dx, dy = (int(value) for value in self.camera.offset - self.backgroundOffset)
+        if self.background is not None \
+                and self.background.get_size() == (width, height) \
+                and revisions == self.backgroundRevisions \
+                and abs(dx) < width and abs(dy) < height:
+            if dx != 0 or dy != 0:
+                self.scrollBackground(dx, dy)
+            return False
+        
+        self.background = pygame.Surface((width, height)).convert()
+        self.background.fill('black')
+        for index, layer in enumerate(self.layers):
+            if layer.static:
+                self.renderLayer(index, layer, self.background)
+        self.backgroundRevisions = revisions
+        self.backgroundOffset = Vector2(self.camera.offset)
+        return True
+
+
+    def exposedRects(self, dx: int, dy: int) -> list[pygame.Rect]:
+        """Strips of the window uncovered when the view moves by (dx, dy) pixels."""
+        width, height = self.window.get_size()
+        rects = []
+        if dx != 0:
+            rects.append(pygame.Rect(width - dx if dx > 0 else 0, 0, abs(dx), height))
+        if dy != 0:
+            rects.append(pygame.Rect(0, height - dy if dy > 0 else 0, width, abs(dy)))
+        return rects
+
+
+    def scrollBackground(self, dx: int, dy: int):
+        # the static layers are only drawn into the strips the camera uncovered
+        self.background.scroll(-dx, -dy)
+        for rect in self.exposedRects(dx, dy):
+            self.background.set_clip(rect)
+            self.background.fill('black')
+            for index, layer in enumerate(self.layers):
+                if layer.static:
+                    self.renderLayer(index, layer, self.background)
+        self.background.set_clip(None)
+        self.backgroundOffset = Vector2(self.camera.offset)
+
+
+    def renderDirty(self):
+        dynamicLayers = [(index, layer) for index, layer in enumerate(self.layers) if not layer.static]
+
+        previousOffset = Vector2(self.backgroundOffset)
+        fullRedraw = self.renderBackground()
+        dx, dy = (int(value) for value in self.backgroundOffset - previousOffset)
+        scrolled = not fullRedraw and (dx != 0 or dy != 0)
+        if fullRedraw:
+            self.window.blit(self.background, (0, 0))
+        else:
+            erase = []
+            if scrolled:
+                # move the previous frame along with the view, sprites included, and fill in the new strips
+                self.window.scroll(-dx, -dy)
+                for rect in self.exposedRects(dx, dy):
+                    self.window.blit(self.background, rect, rect)
+                for _, layer in dynamicLayers:
+                    layer.drawnRects = [rect.move(-dx, -dy) for rect in layer.drawnRects]
+                if self.overlayRect is not None:
+                    erase.append(self.overlayRect.move(-dx, -dy))
+            # erase sprites and overlay of the previous frame
+            for _, layer in dynamicLayers:
+                erase.extend(layer.drawnRects)
+            if self.overlayRect is not None:
+                erase.append(self.overlayRect)
+            for rect in erase:
+                self.window.blit(self.background, rect, rect)
+
+        rects = []
+        if self.overlayRect is not None:
+            rects.append(self.overlayRect)
+        for index, layer in dynamicLayers:
+            layer.beginFrame()
+            self.renderLayer(index, layer, self.window)
+            rects.extend(layer.dirtyRects())
+        if self.renderOverlay() is not None:
+            rects.append(self.overlayRect)
+
+        if fullRedraw or scrolled:
+            # every pixel on screen moved, but only the uncovered strips were drawn again
+            pygame.display.update()
+        else:
+            pygame.display.update(rects)
+
+
+    def runFrame(self, ticks: int = 1):
+        if self.profiler is None:
             self.processInput()
-            self.update()
+            for _ in range(ticks):
+                self.update()
             self.render()
-            self.gameState.epoch += 1
-            self.clock.tick(FPS)
+            return
 
+        profiler = self.profiler
+        profiler.beginFrame(self.gameState.epoch)
+        with profiler.phase('input'):
+            self.processInput()
+        with profiler.phase('update'):
+            for _ in range(ticks):
+                self.update()
+        with profiler.phase('render'):
+            self.render()
+        profiler.endFrame(
+            units=len(self.gameState.units),
+            bullets=len(self.gameState.bullets),
+            explosions=len(self.layers[4].effects),
+        )
+
+
+    def run(self):
+        interval = 1.0 / self.tickRate
+        lag = interval
+        previous = time.perf_counter()
+        while self.running:
+            now = time.perf_counter()
+            lag += now - previous
+            previous = now
+
+            ticks = min(int(lag / interval), self.maxCatchUp)
+            lag -= ticks * interval
+            if lag >= interval:
+                # still behind after catching up: drop the backlog instead of spiralling
+                lag %= interval
+            self.alpha = lag / interval
+            self.runFrame(ticks)
+            self.clock.tick(self.maxFps)
+
+        if self.profiler is not None and self.profileDump is not None:
+            self.profiler.dump(self.profileDump)
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replay is not None and self.replay.desyncEpoch is not None:
+            print('replay desync at epoch {}'.format(self.replay.desyncEpoch))
         pygame.quit()
 
 
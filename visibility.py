@@ -0,0 +1,98 @@
+import math
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from grid_traversal import traverseCellCenters
+
+if TYPE_CHECKING:
+    from game_state import GameState
+
+
+def hasLineOfSight(state: "GameState", x0: int, y0: int, x1: int, y1: int) -> bool:
+    """True if no wall lies on the line between the centers of two cells."""
+    walls = state.walls
+    for x, y in traverseCellCenters(x0, y0, x1, y1):
+        if 0 <= x < walls.width and 0 <= y < walls.height and not walls.isEmpty(x, y):
+            return False
+    return True
+
+
+class VisibilityField:
+    """Cells within radius of a target cell which can see it.
+
+    The field is computed once per target cell and reused until the target
+    moves to another cell or the walls change, so each query is a lookup.
+    """
+
+    def __init__(self, radius: float):
+        self.radius = radius
+        self.key = None
+        self.targetX = 0
+        self.targetY = 0
+        self.size = 0
+        self.visible = np.zeros((0, 0), dtype=bool)
+
+    def update(self, state: "GameState", targetX: int, targetY: int):
+        walls = state.walls
+        key = (id(walls), walls.revision, targetX, targetY, self.radius)
+        if key == self.key:
+            return
+        self.key = key
+        self.targetX = targetX
+        self.targetY = targetY
+
+        size = int(math.floor(self.radius))
+        self.size = size
+        visible = np.zeros((2 * size + 1, 2 * size + 1), dtype=bool)
+        radiusSquared = self.radius ** 2
+        for dy in range(-size, size + 1):
+            y = targetY + dy
+            if y < 0 or y >= walls.height:
+                continue
+            for dx in range(-size, size + 1):
+                x = targetX + dx
+                if x < 0 or x >= walls.width or dx * dx + dy * dy > radiusSquared:
+                    continue
+                visible[dy + size, dx + size] = hasLineOfSight(state, x, y, targetX, targetY)
+        self.visible = visible
+
+    def canSee(self, x: int, y: int) -> bool:
+        """True if cell (x, y) is in radius and sees the target; call update() first."""
+        dx, dy = x - self.targetX, y - self.targetY
+        size = self.size
+        if dx < -size or dx > size or dy < -size or dy > size:
+            return False
+        return bool(self.visible[dy + size, dx + size])
+
+
+def selfTest(maps: int = 20, size: int = 12, density: float = 0.25, seed: int = 0):
+    """Checks on random wall maps that line of sight is symmetric and does not slip through corners."""
+    import random
+    from types import SimpleNamespace
+    from tile_grid import ChunkedTileGrid, EMPTY
+
+    # two walls touching at a corner block the diagonal between them, from both sides
+    walls = np.full((12, 12), EMPTY, dtype=np.int32)
+    walls[5, 5] = walls[6, 6] = 0
+    state = SimpleNamespace(walls=ChunkedTileGrid(12, 12, 1, walls))
+    if hasLineOfSight(state, 4, 10, 6, 4) or hasLineOfSight(state, 6, 4, 4, 10):
+        raise RuntimeError("Error in selfTest: line of sight passes between two diagonal walls")
+
+    rng = random.Random(seed)
+    pairs = 0
+    for _ in range(maps):
+        walls = np.where(np.array([[rng.random() < density for _ in range(size)] for _ in range(size)]), 0, EMPTY)
+        state = SimpleNamespace(walls=ChunkedTileGrid(size, size, 1, walls.astype(np.int32)))
+        cells = [(x, y) for y in range(size) for x in range(size) if walls[y, x] == EMPTY]
+        for index, (x0, y0) in enumerate(cells):
+            for x1, y1 in cells[index + 1:]:
+                pairs += 1
+                if hasLineOfSight(state, x0, y0, x1, y1) != hasLineOfSight(state, x1, y1, x0, y0):
+                    raise RuntimeError("Error in selfTest: line of sight between {} and {} is not symmetric"
+                                       .format((x0, y0), (x1, y1)))
+    print('line of sight symmetric for {} cell pairs on {} maps'.format(pairs, maps))
+
+
+if __name__ == '__main__':
+    selfTest()